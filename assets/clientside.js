@@ -12,6 +12,36 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
       }
       return "";
     }
+  },
+  ui: {
+    toggle: function(n_clicks, is_open) {
+      if (!n_clicks) {
+        return window.dash_clientside.no_update;
+      }
+      return !is_open;
+    },
+    datalist: function(history) {
+      return (history || []).map(function(value) {
+        return {type: "Option", namespace: "dash_html_components", props: {value: value}};
+      });
+    }
+  },
+  downloads: {
+    start: function(url) {
+      if (!url) {
+        return window.dash_clientside.no_update;
+      }
+      // A download link instead of navigating: if the id has expired, the browser
+      // reports a failed download rather than unloading the app for the 404 page
+      var link = document.createElement("a");
+      link.href = url;
+      link.download = "";
+      link.style.display = "none";
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      return "";
+    }
   }
 });
 
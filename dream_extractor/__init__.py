@@ -1,6 +1,10 @@
+import os
 import dash
 import dash_bootstrap_components as dbc
 
+# The repository-level assets/ (clientside callbacks, stylesheet), shared with app.py
+ASSETS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
 
 def create_app() -> tuple[dash.Dash, "dash.Dash.server"]:
     """
@@ -8,6 +12,7 @@ def create_app() -> tuple[dash.Dash, "dash.Dash.server"]:
     """
     app = dash.Dash(
         __name__,
+        assets_folder=ASSETS_FOLDER,
         external_stylesheets=[
             dbc.themes.LUX,
             dbc.icons.BOOTSTRAP,
@@ -1,16 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 from dash import Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
 import dash
-import pymongo
 import json
-from ..config import DEFAULT_DB_NAME
+import uuid
+from ..config import DEFAULT_DB_NAME, ENSURE_INDEXES
 from ..services.mongo import (
     build_mongodb_uri,
-    fetch_config_keys,
-    fetch_runs_docs,
-    fetch_metrics_values_map,
+    drop_client,
+    ensure_indexes,
+    fetch_connect_bundle,
+    fetch_runs_with_metrics,
+    leased_client,
 )
-from ..services.data import collect_metric_ids_from_runs
+from ..services.data import config_summary_for, scan_metric_names_and_results
+from ..state.cache import CONNECT_RESULT_CACHE, METRICS_PAYLOAD_CACHE, RUNS_CACHE, LRUCache
+
+
+# Connect attempts run off the Dash worker; the browser polls for their outcome by job id
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="connect")
+_JOBS = LRUCache(maxsize=16)
+
+
+def _connect(uri: str, db_name: str):
+    """
+    Ping, index and load `db_name`. Returns (status text, alert color, result) where
+    result is (runs-token, config keys, metric names, result keys), or None on failure.
+    """
+    with leased_client(uri) as client:
+        try:
+            client.admin.command("ping")
+        except Exception as exc:
+            drop_client(uri)
+            return f"Connection failed: {exc}", "danger", None
+
+        try:
+            if ENSURE_INDEXES:
+                ensure_indexes(client, db_name)
+            # The facet bundle and the runs/metrics join are independent round trips;
+            # MongoClient is thread-safe and pymongo releases the GIL while waiting
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                bundle_future = pool.submit(fetch_connect_bundle, client, db_name, include_runs=False)
+                runs, metrics_values_map = fetch_runs_with_metrics(client, db_name)
+                bundle = bundle_future.result()
+            keys = bundle["keys"]
+
+            metrics, results_keys_sorted = bundle["metric_names"], bundle["result_keys"]
+            if metrics is None or results_keys_sorted is None:
+                metrics, results_keys_sorted = scan_metric_names_and_results(runs)
+
+            runs_token = uuid.uuid4().hex
+            RUNS_CACHE[runs_token] = runs
+            METRICS_PAYLOAD_CACHE[runs_token] = metrics_values_map
+            # Still in the background job: warm the key summary the key lists render first
+            config_summary_for(runs, runs_token)
+            result = (runs_token, keys, metrics, results_keys_sorted)
+            CONNECT_RESULT_CACHE[(uri, db_name)] = result
+            return f"Connected. Database '{db_name}' has {len(runs)} run(s).", "success", result
+        except Exception as exc:
+            return f"Connected, but failed to query runs/config keys: {exc}", "danger", None
+
+
+def _resolve_db_name(db_name_value, saved_creds, db_history) -> str:
+    # Typed name, else the saved one, else the most recent one, else the default
+    resolved_db_name = (db_name_value or "").strip()
+    if resolved_db_name:
+        return resolved_db_name
+    saved_db_name = ""
+    try:
+        saved_db_name = ((saved_creds or {}).get("db_name") or "").strip() if isinstance(saved_creds, dict) else ""
+    except Exception:
+        saved_db_name = ""
+    if saved_db_name:
+        return saved_db_name
+    if db_history and isinstance(db_history, list) and len(db_history) > 0:
+        return db_history[0]
+    return DEFAULT_DB_NAME
+
+
+def _cached_connect(uri: str, db_name: str):
+    # Reconnecting to the same database shortly after: reuse the previous result
+    cached = CONNECT_RESULT_CACHE.get((uri, db_name))
+    if cached is None:
+        return None
+    runs = RUNS_CACHE.get(cached[0])
+    if runs is None or cached[0] not in METRICS_PAYLOAD_CACHE:
+        return None
+    return f"Connected. Database '{db_name}' has {len(runs)} run(s).", "success", cached
+
+
+def _connect_outputs(outcome, existing_config_store) -> tuple:
+    """
+    (status children, color, is_open, runs-token, config-keys-store, metrics-store,
+    results-store) for a `_connect` outcome, keeping still-existing selected keys.
+    """
+    status_text, color, result = outcome
+    if result is None:
+        return status_text, color, True, no_update, no_update, no_update, no_update
+    runs_token, keys, metrics, results_keys_sorted = result
+    existing_selected = []
+    if existing_config_store and isinstance(existing_config_store, dict):
+        existing_selected = list(existing_config_store.get("selected", []) or [])
+    keys_set = set(keys)
+    merged_selected = [k for k in existing_selected if k in keys_set]
+    config_store = {"available": keys, "selected": merged_selected}
+    return status_text, color, True, runs_token, config_store, metrics, results_keys_sorted
 
 
 def register_connection_callbacks(app):
@@ -18,11 +113,12 @@ def register_connection_callbacks(app):
         Output("status-alert", "children"),
         Output("status-alert", "color"),
         Output("status-alert", "is_open"),
-        Output("runs-cache", "data"),
+        Output("runs-token", "data"),
         Output("config-keys-store", "data"),
         Output("metrics-store", "data"),
-        Output("metrics-values-store", "data"),
         Output("results-store", "data"),
+        Output("connect-job", "data"),
+        Output("connect-poll", "disabled"),
         Input("connect-button", "n_clicks"),
         Input("init-tick", "n_intervals"),
         State("uri-input", "value"),
@@ -30,7 +126,7 @@ def register_connection_callbacks(app):
         State("port-input", "value"),
         State("username-input", "value"),
         State("password-input", "value"),
-    State("authsource-input", "value"),
+        State("authsource-input", "value"),
         State("db-name-input", "value"),
         State("creds-store", "data"),
         State("db-history", "data"),
@@ -45,8 +141,8 @@ def register_connection_callbacks(app):
         port_value: str,
         username_value: str,
         password_value: str,
-        db_name_value: str,
         auth_source_value: str,
+        db_name_value: str,
         saved_creds,
         db_history,
         existing_config_store,
@@ -56,23 +152,10 @@ def register_connection_callbacks(app):
 
         if triggered is None:
             initial_text = "Connecting..."
-            return initial_text, "light", True, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+            return (initial_text, "light", True) + (dash.no_update,) * 6
 
         auto_triggered = (triggered == "init-tick")
-
-        resolved_db_name = (db_name_value or "").strip()
-        if not resolved_db_name:
-            saved_db_name = ""
-            try:
-                saved_db_name = ((saved_creds or {}).get("db_name") or "").strip() if isinstance(saved_creds, dict) else ""
-            except Exception:
-                saved_db_name = ""
-            if saved_db_name:
-                resolved_db_name = saved_db_name
-            elif db_history and isinstance(db_history, list) and len(db_history) > 0:
-                resolved_db_name = db_history[0]
-            else:
-                resolved_db_name = DEFAULT_DB_NAME
+        resolved_db_name = _resolve_db_name(db_name_value, saved_creds, db_history)
 
         if auto_triggered and saved_creds:
             uri_from_user = (saved_creds or {}).get("uri") or uri_value
@@ -98,55 +181,71 @@ def register_connection_callbacks(app):
             database_name=resolved_db_name,
             auth_source=auth_source,
         )
-        try:
-            client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000)
-            client.admin.command("ping")
-        except Exception as exc:
-            status_text = f"Connection failed: {exc}"
-            return status_text, "danger", True, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
+        cached = _cached_connect(uri, resolved_db_name)
+        if cached is not None:
+            return _connect_outputs(cached, existing_config_store) + (dash.no_update, True)
+
+        # Answer straight away; poll_connect picks up the outcome when the job is done
+        job_id = uuid.uuid4().hex
+        _JOBS[job_id] = _EXECUTOR.submit(_connect, uri, resolved_db_name)
+        status_text = f"Connecting to '{resolved_db_name}'..."
+        return (status_text, "light", True) + (dash.no_update,) * 4 + (job_id, False)
+
+    @app.callback(
+        Output("status-alert", "children", allow_duplicate=True),
+        Output("status-alert", "color", allow_duplicate=True),
+        Output("status-alert", "is_open", allow_duplicate=True),
+        Output("runs-token", "data", allow_duplicate=True),
+        Output("config-keys-store", "data", allow_duplicate=True),
+        Output("metrics-store", "data", allow_duplicate=True),
+        Output("results-store", "data", allow_duplicate=True),
+        Output("connect-poll", "disabled", allow_duplicate=True),
+        Input("connect-poll", "n_intervals"),
+        State("connect-job", "data"),
+        State("config-keys-store", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_connect(n_intervals, job_id, existing_config_store):
+        future = _JOBS.get(job_id) if job_id else None
+        if future is None:
+            return ("Connection attempt expired, please connect again.", "warning", True) + (no_update,) * 4 + (True,)
+        if not future.done():
+            raise PreventUpdate
+        _JOBS.pop(job_id)
         try:
-            keys = fetch_config_keys(client, resolved_db_name)
-            runs = fetch_runs_docs(client, resolved_db_name)
-
-            metric_names = set()
-            for r in runs:
-                m = r.get("metrics", None)
-                if isinstance(m, dict):
-                    for k in m.keys():
-                        if isinstance(k, str) and k.strip():
-                            metric_names.add(k)
-                elif isinstance(m, list):
-                    for item in m:
-                        if isinstance(item, dict):
-                            nm = item.get("name")
-                            if isinstance(nm, str) and nm.strip():
-                                metric_names.add(nm)
-
-            metrics = sorted(metric_names)
-            metric_ids = collect_metric_ids_from_runs(runs)
-            metrics_values_map = fetch_metrics_values_map(client, resolved_db_name, metric_ids)
-
-            result_keys = set()
-            for r in runs:
-                res = r.get("result", None)
-                if isinstance(res, dict):
-                    for k in res.keys():
-                        if isinstance(k, str) and k.strip():
-                            result_keys.add(k)
-            results_keys_sorted = sorted(result_keys)
-            count = len(runs)
-            status_text = f"Connected. Database '{resolved_db_name}' has {count} run(s)."
-
-            existing_selected = []
-            if existing_config_store and isinstance(existing_config_store, dict):
-                existing_selected = list(existing_config_store.get("selected", []) or [])
-            merged_selected = [k for k in existing_selected if k in set(keys)]
-            config_store = {"available": keys, "selected": merged_selected}
-            return status_text, "success", True, runs, config_store, metrics, metrics_values_map, results_keys_sorted
+            outcome = future.result()
         except Exception as exc:
-            status_text = f"Connected, but failed to query runs/config keys: {exc}"
-            return status_text, "danger", True, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+            outcome = (f"Connection failed: {exc}", "danger", None)
+        return _connect_outputs(outcome, existing_config_store) + (True,)
+
+    @app.callback(
+        Output("status-alert", "children", allow_duplicate=True),
+        Output("status-alert", "color", allow_duplicate=True),
+        Output("status-alert", "is_open", allow_duplicate=True),
+        Output("runs-token", "data", allow_duplicate=True),
+        Input("config-keys-store", "data"),
+        Input("filters-store", "data"),
+        Input("metrics-select", "value"),
+        Input("results-select", "value"),
+        Input("experiments-table", "page_current"),
+        Input("metrics-steps-table", "page_current"),
+        Input("download-exp-open", "n_clicks"),
+        Input("download-steps-open", "n_clicks"),
+        Input("open-pygwalker-exp-btn", "n_clicks"),
+        Input("open-pygwalker-btn", "n_clicks"),
+        State("runs-token", "data"),
+        prevent_initial_call=True,
+    )
+    def check_runs_token(*args):
+        # The loaded runs live server-side and expire when idle (RUNS_CACHE_TTL) or are
+        # pushed out by other connects; reading them here also keeps an active view alive
+        runs_token = args[-1]
+        if not runs_token or (runs_token in RUNS_CACHE and runs_token in METRICS_PAYLOAD_CACHE):
+            raise PreventUpdate
+        RUNS_CACHE.pop(runs_token)
+        METRICS_PAYLOAD_CACHE.pop(runs_token)
+        return "The loaded runs are no longer held by the server, please connect again.", "warning", True, None
 
     @app.callback(
         Output("creds-store", "data"),
@@ -160,6 +259,8 @@ def register_connection_callbacks(app):
         State("authsource-input", "value"),
         State("db-name-input", "value"),
         State("save-options", "value"),
+        State("creds-store", "data"),
+        State("db-history", "data"),
         prevent_initial_call=True,
     )
     def update_saved_credentials(
@@ -173,6 +274,8 @@ def register_connection_callbacks(app):
         auth_source_value,
         db_name_value,
         save_options,
+        saved_creds,
+        db_history,
     ):
         ctx = dash.callback_context  # type: ignore
         if not ctx.triggered:
@@ -180,6 +283,18 @@ def register_connection_callbacks(app):
         trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
 
         if trigger_id == "clear-saved-button":
+            # Forget this user's cached connect results too (typed and saved credentials);
+            # other sessions' results and the shared client pool are left alone
+            db_name = _resolve_db_name(db_name_value, saved_creds, db_history)
+            typed = (uri_value, host_value, port_value, username_value, password_value, auth_source_value)
+            candidates = [typed]
+            if isinstance(saved_creds, dict) and saved_creds:
+                # What the auto-connect on page load uses, see on_connect_click
+                fields = ("uri", "host", "port", "username", "password", "authSource")
+                candidates.append(tuple(saved_creds.get(f) or v for f, v in zip(fields, typed)))
+            for uri_from_user, host, port, username, password, auth_source in candidates:
+                uri = build_mongodb_uri(uri_from_user, host, port, username, password, db_name, auth_source)
+                CONNECT_RESULT_CACHE.pop((uri, db_name))
             return {}
 
         save_enabled = "save" in (save_options or [])
@@ -209,7 +324,7 @@ def register_connection_callbacks(app):
     )
     def populate_inputs_from_saved(data):
         if not data:
-            return no_update, no_update, no_update, no_update, no_update, no_update
+            return (no_update,) * 7
 
         save_values = ["save"] if any([data.get("uri"), data.get("host"), data.get("port"), data.get("username"), data.get("db_name"), data.get("password")]) else []
 
@@ -0,0 +1,42 @@
+import unicodedata
+from urllib.parse import quote
+from dash import Input, Output, ClientsideFunction
+from flask import Response, make_response, request, stream_with_context
+from ..services.data import iter_csv
+from ..state.cache import DOWNLOAD_CACHE
+
+
+def _content_disposition(filename: str) -> str:
+    """
+    `attachment` header value for a user-chosen file name. WSGI servers write headers
+    as latin-1 and reject CR/LF, so the plain `filename=` gets an ASCII rendering
+    (as flask.send_file does) and the exact name goes into RFC 5987 `filename*=`.
+    """
+    name = "".join(ch for ch in filename if ch.isprintable()).replace('"', "").replace("\\", "")
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").strip() or "download.csv"
+    value = f'attachment; filename="{ascii_name}"'
+    if ascii_name != name:
+        value += f"; filename*=UTF-8''{quote(name, safe='')}"
+    return value
+
+
+def register_downloads(app, server):
+    # Point the browser at the streaming route (client-side via ClientsideFunction)
+    app.clientside_callback(
+        ClientsideFunction(namespace="downloads", function_name="start"),
+        Output("download-start-dummy", "children"),
+        Input("download-url", "data"),
+    )
+
+    @server.route("/download")
+    def download_route():
+        key = request.args.get("id", "").strip()
+        entry = DOWNLOAD_CACHE.pop(key)
+        if entry is None:
+            resp = make_response("Download expired, please try again.")
+            resp.headers["Content-Type"] = "text/plain; charset=utf-8"
+            return resp, 404
+        filename, col_names, col_ids, rows = entry
+        resp = Response(stream_with_context(iter_csv(col_names, col_ids, rows)), mimetype="text/csv")
+        resp.headers["Content-Disposition"] = _content_disposition(filename)
+        return resp
@@ -1,90 +1,128 @@
-from typing import Dict, List
-from dash import Input, Output, State, no_update, dcc
-import io
-import csv
-import json
-from ..services.data import build_table_from_runs
+from math import ceil
+from typing import Dict, Iterator, List, Optional, Tuple
+from dash import Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
+import uuid
+from ..services.data import build_table_from_runs, cell_json, dumps_json, filter_runs
+from ..state.cache import DOWNLOAD_CACHE, EXPERIMENT_VIEW_CACHE, RUNS_CACHE
+
+
+def _filtered_runs(runs_token, selected: List[str], active_filters: Dict) -> List[Dict]:
+    # Paging through the same view must not re-filter, so keep it per (token, filters)
+    view_key = dumps_json([runs_token, selected, active_filters], sort_keys=True)
+    filtered = EXPERIMENT_VIEW_CACHE.get(view_key)
+    if filtered is None:
+        runs = RUNS_CACHE.get(runs_token) or []
+        filtered = filter_runs(runs, selected, active_filters, runs_token)
+        EXPERIMENT_VIEW_CACHE[view_key] = filtered
+    return filtered
+
+
+def _result_columns(columns: List[Dict], rows: List[Dict], runs: List[Dict], result_keys: List[str]) -> None:
+    # Append one "result:<key>" column per result key, filling `rows` (parallel to `runs`) in place
+    result_cols = [(key, f"result:{key}") for key in result_keys]
+    columns.extend({"name": key, "id": cid} for key, cid in result_cols)
+    blank = dict.fromkeys((cid for _, cid in result_cols), "")
+    for row, run in zip(rows, runs):
+        r = run.get("result", None)
+        if not isinstance(r, dict) or len(r) == 0:
+            row.update(blank)
+            continue
+        for key, cid in result_cols:
+            val = r.get(key, None)
+            if val is None:
+                row[cid] = ""
+            elif type(val) in (list, dict):
+                try:
+                    row[cid] = cell_json(val)
+                except Exception:
+                    row[cid] = str(val)
+            else:
+                row[cid] = val
+
+
+def _table_view(runs_token, config_store, filters_store, selected_result_keys) -> Tuple[List[str], List[Dict], List[str]]:
+    # (selected config keys, filtered runs, result keys) for the UI state
+    selected = (config_store or {}).get("selected", []) or []
+    filtered_runs = _filtered_runs(runs_token, selected, filters_store or {})
+    result_keys = [k for k in (selected_result_keys or []) if type(k) is str and k.strip()]
+    return selected, filtered_runs, result_keys
+
+
+def _table_rows(runs: List[Dict], selected: List[str], result_keys: List[str]) -> Tuple[List[Dict], List[Dict]]:
+    columns, rows = build_table_from_runs(runs, selected)
+    if len(result_keys) > 0:
+        _result_columns(columns, rows, runs, result_keys)
+    return columns, rows
+
+
+def experiments_table(
+    runs_token, config_store, filters_store, selected_result_keys, page: Optional[Tuple[int, int]] = None
+) -> Tuple[List[Dict], List[Dict], int]:
+    """
+    (columns, rows, total row count) of the experiments table for the UI state. With
+    `page=(page_current, page_size)` only that page's rows are built.
+    """
+    selected, filtered_runs, result_keys = _table_view(runs_token, config_store, filters_store, selected_result_keys)
+    total = len(filtered_runs)
+    if page is not None:
+        start = page[0] * page[1]
+        filtered_runs = filtered_runs[start:start + page[1]]
+
+    columns, rows = _table_rows(filtered_runs, selected, result_keys)
+    return columns, rows, total
+
+
+def iter_experiments_rows(
+    runs_token, config_store, filters_store, selected_result_keys, chunk_runs: int = 1000
+) -> Tuple[List[Dict], int, Iterator[Dict]]:
+    """
+    (columns, total row count, lazy rows) of the whole experiments view. Rows are
+    built `chunk_runs` runs at a time as the iterator is consumed, so a streamed
+    download never holds every row of the table at once.
+    """
+    selected, filtered_runs, result_keys = _table_view(runs_token, config_store, filters_store, selected_result_keys)
+    columns, _ = _table_rows([], selected, result_keys)
+
+    def rows() -> Iterator[Dict]:
+        for start in range(0, len(filtered_runs), chunk_runs):
+            yield from _table_rows(filtered_runs[start:start + chunk_runs], selected, result_keys)[1]
+
+    return columns, len(filtered_runs), rows()
+
+
+def _page_size(value) -> int:
+    try:
+        v = int(value)
+        return v if v and v > 0 else 10
+    except Exception:
+        return 10
 
 
 def register_experiments_callbacks(app):
     @app.callback(
         Output("experiments-table", "columns"),
         Output("experiments-table", "data"),
-        Input("runs-cache", "data"),
+        Output("experiments-table", "page_count"),
+        Output("experiments-table", "page_current"),
+        Input("runs-token", "data"),
         Input("config-keys-store", "data"),
         Input("filters-store", "data"),
         Input("results-select", "value"),
+        Input("experiments-table", "page_current"),
+        Input("experiments-table", "page_size"),
     )
-    def refresh_table(runs_cache, config_store, filters_store, selected_result_keys):
-        runs = runs_cache or []
-        selected = (config_store or {}).get("selected", [])
-
-        active_filters = filters_store or {}
-
-        def row_passes_filters(run_cfg: Dict) -> bool:
-            for key in selected:
-                f = active_filters.get(key) if isinstance(active_filters, dict) else None
-                if not f:
-                    continue
-                value = run_cfg.get(key, None) if isinstance(run_cfg, dict) else None
-
-                mode = f.get("mode") if isinstance(f, dict) else None
-                if mode in ("true", "false"):
-                    if not isinstance(value, bool):
-                        return False
-                    desired = (mode == "true")
-                    if value != desired:
-                        return False
-
-                has_min = "min" in f and f.get("min") is not None
-                has_max = "max" in f and f.get("max") is not None
-                if has_min or has_max:
-                    if not isinstance(value, (int, float)) or isinstance(value, bool):
-                        return False
-                    if has_min and value < f.get("min"):
-                        return False
-                    if has_max and value > f.get("max"):
-                        return False
-
-                values = f.get("values") if isinstance(f, dict) else None
-                if isinstance(values, list) and len(values) > 0:
-                    if not isinstance(value, str):
-                        return False
-                    if value not in values:
-                        return False
-            return True
-
-        filtered_runs = []
-        for run in runs:
-            cfg = run.get("config", {}) or {}
-            if row_passes_filters(cfg):
-                filtered_runs.append(run)
-
-        columns, rows = build_table_from_runs(filtered_runs, selected)
-
-        result_keys = [k for k in (selected_result_keys or []) if isinstance(k, str) and k.strip()]
-        if len(result_keys) > 0:
-            for key in result_keys:
-                columns.append({"name": key, "id": f"result:{key}"})
-            for idx, run in enumerate(filtered_runs):
-                if idx >= len(rows):
-                    continue
-                r = run.get("result", None)
-                if not isinstance(r, dict) or len(r) == 0:
-                    for key in result_keys:
-                        rows[idx][f"result:{key}"] = ""
-                else:
-                    for key in result_keys:
-                        val = r.get(key, None)
-                        if val is None:
-                            rows[idx][f"result:{key}"] = ""
-                        else:
-                            try:
-                                rows[idx][f"result:{key}"] = json.dumps(val, ensure_ascii=False, default=str) if isinstance(val, (list, dict)) else val
-                            except Exception:
-                                rows[idx][f"result:{key}"] = str(val)
-
-        return columns, rows
+    def refresh_table(runs_token, config_store, filters_store, selected_result_keys, page_current, page_size):
+        # page_action="custom": only the visible page is built and sent to the browser
+        size = _page_size(page_size)
+        current = page_current if type(page_current) is int and page_current > 0 else 0
+        columns, rows, total = experiments_table(runs_token, config_store, filters_store, selected_result_keys, (current, size))
+        page_count = max(1, ceil(total / size))
+        if current >= page_count:
+            # The view shrank (new filters); jump back to the first page
+            current = 0
+            columns, rows, total = experiments_table(runs_token, config_store, filters_store, selected_result_keys, (0, size))
+        return columns, rows, page_count, current
 
     @app.callback(
         Output("download-exp-modal", "is_open"),
@@ -104,12 +142,8 @@ def register_experiments_callbacks(app):
         prevent_initial_call=True,
     )
     def set_experiments_page_size(value):
-        try:
-            v = int(value)
-            v = v if v and v > 0 else 10
-            return v, v
-        except Exception:
-            return 10, 10
+        v = _page_size(value)
+        return v, v
 
     @app.callback(
         Output("experiments-page-size-input", "value", allow_duplicate=True),
@@ -117,84 +151,73 @@ def register_experiments_callbacks(app):
         prevent_initial_call=True,
     )
     def restore_experiments_page_size(saved):
-        try:
-            v = int(saved)
-            return v if v and v > 0 else 10
-        except Exception:
-            return 10
+        return _page_size(saved)
 
     @app.callback(
-        Output("download-exp-csv", "data"),
+        Output("download-url", "data", allow_duplicate=True),
         Input("download-exp-confirm", "n_clicks"),
         State("download-exp-filename", "value"),
-        State("experiments-table", "columns"),
-        State("experiments-table", "data"),
+        State("runs-token", "data"),
+        State("config-keys-store", "data"),
+        State("filters-store", "data"),
+        State("results-select", "value"),
         prevent_initial_call=True,
     )
-    def download_exp_csv(n_clicks, filename, columns, data_rows):
+    def download_exp_csv(n_clicks, filename, runs_token, config_store, filters_store, selected_result_keys):
         if not n_clicks:
             return no_update
-        rows = data_rows or []
-        cols = columns or []
-        if len(rows) == 0 or len(cols) == 0:
+        # The table only holds the current page; export the whole filtered view, with its
+        # rows built from the cached runs while /download streams them
+        cols, total, rows = iter_experiments_rows(runs_token, config_store, filters_store, selected_result_keys)
+        if total == 0 or len(cols) == 0:
             return no_update
 
-        col_ids = [c.get("id") for c in cols if isinstance(c, dict) and c.get("id")]
+        col_ids = [c.get("id") for c in cols if type(c) is dict and c.get("id")]
         col_names = [c.get("name", c.get("id")) for c in cols]
 
-        buf = io.StringIO()
-        writer = csv.writer(buf)
-        writer.writerow(col_names)
-
-        def stringify(v):
-            if isinstance(v, (list, dict, tuple)):
-                try:
-                    return json.dumps(v, ensure_ascii=False, default=str)
-                except Exception:
-                    return str(v)
-            return v
-
-        for row in rows:
-            writer.writerow([stringify(row.get(cid, "")) for cid in col_ids])
-
-        csv_str = buf.getvalue()
-        buf.close()
         safe_name = (filename or "").strip() or "experiments.csv"
         if not safe_name.lower().endswith(".csv"):
             safe_name += ".csv"
-        return dcc.send_string(csv_str, safe_name)
+        key = str(uuid.uuid4())
+        DOWNLOAD_CACHE[key] = (safe_name, col_names, col_ids, rows)
+        return f"/download?id={key}"
 
     @app.callback(
         Output("results-select", "options"),
+        Output("results-all-values-store", "data"),
         Output("results-controls-row", "style"),
         Output("results-none-note", "children"),
         Input("results-store", "data"),
+        State("results-all-values-store", "data"),
     )
-    def populate_results_checklist(result_keys):
+    def populate_results_checklist(result_keys, current_keys):
         keys = result_keys or []
-        if not isinstance(keys, list):
+        if type(keys) is not list:
             keys = []
-        keys = sorted([k for k in keys if isinstance(k, str) and k.strip()])
+        keys = sorted(k for k in keys if type(k) is str and k.strip())
+        if keys and keys == current_keys:
+            # Same keys as already rendered (e.g. a reconnect): don't resend the options
+            raise PreventUpdate
         if len(keys) == 0:
-            return [], {"display": "none"}, ""
-        return [{"label": k, "value": k} for k in keys], {}, ""
+            return [], [], {"display": "none"}, ""
+        return [{"label": k, "value": k} for k in keys], keys, {}, ""
 
     @app.callback(
         Output("results-select", "value"),
         Input("results-toggle-all", "n_clicks"),
-        State("results-select", "options"),
+        State("results-all-values-store", "data"),
         State("results-select", "value"),
         prevent_initial_call=True,
     )
-    def toggle_all_results(n_clicks, options, current_values):
+    def toggle_all_results(n_clicks, all_values, current_values):
         if not n_clicks:
             return no_update
-        all_values = [opt.get("value") for opt in (options or []) if isinstance(opt, dict)]
+        # The option values, written alongside the options by populate_results_checklist
         if not all_values:
             return no_update
-        current_set = set(current_values or [])
-        all_set = set(all_values)
-        if current_set == all_set:
+        current_values = current_values or []
+        # A length mismatch already means "not everything selected"; only equal lengths need the sets
+        if len(current_values) == len(all_values) and set(current_values) == set(all_values):
             return []
         return all_values
 
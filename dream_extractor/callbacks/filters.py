@@ -1,9 +1,50 @@
 from typing import Dict, List
-import json
+import itertools
+import re
 from dash import html, dcc
 from dash import Input, Output, State, ALL, no_update
+from dash.exceptions import PreventUpdate
 import dash
 import dash_bootstrap_components as dbc
+from ..services.data import config_summary_for, dumps_json, loads_json
+from ..state.cache import RUNS_CACHE
+
+# Seconds a numeric bound must stay unchanged before it is sent (and the tables refresh)
+FILTER_INPUT_DEBOUNCE_S = 0.3
+# Most distinct values offered by a string filter dropdown; very wide keys get a "more" marker
+MAX_STRING_FILTER_OPTIONS = 500
+_NOWRAP_STYLE = {"whiteSpace": "nowrap"}
+
+
+# Pattern-matching ids the way Dash stringifies them (keys sorted, no whitespace)
+_TRIGGER_ID_RE = re.compile(r'\{"key":"(?P<key>[^"\\]*)","type":"(?P<type>[^"\\]*)"\}')
+
+
+def _parse_trigger_id(prop_ref: str) -> Dict:
+    m = _TRIGGER_ID_RE.fullmatch(prop_ref)
+    if m is not None:
+        return {"key": m.group("key"), "type": m.group("type")}
+    # Escaped characters or other shapes: let the JSON parser handle it
+    return loads_json(prop_ref)
+
+
+def _string_filter_options(values: List[str], current: List[str]) -> List[Dict]:
+    """
+    Dropdown options for the (sorted) distinct `values`, capped at
+    MAX_STRING_FILTER_OPTIONS. Values already picked stay available past the cap.
+    """
+    shown = values[:MAX_STRING_FILTER_OPTIONS]
+    options = [{"label": v, "value": v} for v in shown]
+    hidden = len(values) - len(shown)
+    if hidden > 0:
+        shown_set = set(shown)
+        options.extend({"label": v, "value": v} for v in current if type(v) is str and v not in shown_set)
+        options.append({"label": f"(... {hidden} more)", "value": "__more_values__", "disabled": True})
+    return options
+
+
+def _config_summary(runs_token):
+    return config_summary_for(RUNS_CACHE.get(runs_token) or [], runs_token)
 
 
 def register_filters_callbacks(app):
@@ -12,78 +53,34 @@ def register_filters_callbacks(app):
         Output("config-keys-select", "value"),
         Output("config-keys-select", "style"),
         Output("config-keys-none-note", "children"),
+        Output("config-keys-dropdown-signature", "data"),
         Input("config-keys-store", "data"),
-        Input("runs-cache", "data"),
+        Input("runs-token", "data"),
+        State("config-keys-dropdown-signature", "data"),
         prevent_initial_call=False,
     )
-    def populate_config_keys_dropdown(store, runs_cache):
+    def populate_config_keys_dropdown(store, runs_token, last_signature):
         data = store or {"available": [], "selected": []}
         available = data.get("available", []) or []
         selected = data.get("selected", []) or []
+        # The store is often rewritten with the same content (e.g. echoing this dropdown's value)
+        signature = dumps_json([available, selected, runs_token])
+        if signature == last_signature:
+            raise PreventUpdate
         all_keys = sorted(set(list(available) + list(selected)))
 
         # Compute type and distinct value counts across all known keys
-        runs = runs_cache or []
-        def type_name_for_value(value):
-            if value is None:
-                return None
-            if isinstance(value, bool):
-                return "boolean"
-            if isinstance(value, (int, float)) and not isinstance(value, bool):
-                return "number"
-            if isinstance(value, str):
-                return "string"
-            if isinstance(value, list):
-                return "list"
-            if isinstance(value, dict):
-                return "dict"
-            return "unknown"
-
-        key_to_type: Dict[str, str] = {}
-        for key in all_keys:
-            seen_types = set()
-            for run in runs:
-                cfg = run.get("config", {}) or {}
-                if isinstance(cfg, dict) and key in cfg:
-                    t = type_name_for_value(cfg.get(key))
-                    if t is not None:
-                        seen_types.add(t)
-                if len(seen_types) > 1:
-                    break
-            if len(seen_types) == 0:
-                key_to_type[key] = "unknown"
-            elif len(seen_types) == 1:
-                key_to_type[key] = next(iter(seen_types))
-            else:
-                key_to_type[key] = "mixed"
-
-        def encode_for_set(value):
-            try:
-                return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
-            except Exception:
-                return str(value)
-
-        key_to_value_count: Dict[str, int] = {}
-        for key in all_keys:
-            distinct = set()
-            for run in runs:
-                cfg = run.get("config", {}) or {}
-                if not isinstance(cfg, dict):
-                    continue
-                v = cfg.get(key, None)
-                if v is None:
-                    continue
-                distinct.add(encode_for_set(v))
-            key_to_value_count[key] = len(distinct)
+        key_to_type, key_to_value_count, _ = _config_summary(runs_token)
 
         options = [{"label": f"{k} ({key_to_type.get(k, 'unknown')} {key_to_value_count.get(k, 0)})", "value": k} for k in all_keys]
         if len(options) == 0:
-            return [], [], {"display": "none"}, "No config keys found"
+            return [], [], {"display": "none"}, "No config keys found", signature
         # Keep only selected that are still present in all_keys
-        selected_clean = [k for k in selected if k in set(all_keys)]
+        all_keys_set = set(all_keys)
+        selected_clean = [k for k in selected if k in all_keys_set]
         # Note: show hint when all selected
         note = "All keys selected" if (len(selected_clean) == len(all_keys) and len(all_keys) > 0) else ""
-        return options, selected_clean, {}, note
+        return options, selected_clean, {}, note, signature
 
     @app.callback(
         Output("config-keys-store", "data", allow_duplicate=True),
@@ -95,91 +92,32 @@ def register_filters_callbacks(app):
         store = store or {"available": [], "selected": []}
         available_old = list(store.get("available", []) or [])
         selected_old = list(store.get("selected", []) or [])
-        all_keys = list(dict.fromkeys(list(available_old) + list(selected_old)))
-        selected_set = set(k for k in (selected_values or []) if k in set(all_keys))
-        available = [k for k in all_keys if k not in selected_set]
-        selected = [k for k in all_keys if k in selected_set]
+        incoming = set(selected_values or [])
+        seen = set()
+        available, selected = [], []
+        # One ordered pass over both lists: dedupe with `seen`, route by `incoming`
+        for k in itertools.chain(available_old, selected_old):
+            if k in seen:
+                continue
+            seen.add(k)
+            (selected if k in incoming else available).append(k)
         return {"available": available, "selected": selected}
 
     @app.callback(
         Output("available-keys", "children"),
-        Output("selected-keys", "children"),
+        Output("available-keys-signature", "data"),
         Input("config-keys-store", "data"),
-        Input("runs-cache", "data"),
-        Input("filters-store", "data"),
+        Input("runs-token", "data"),
+        State("available-keys-signature", "data"),
     )
-    def render_key_lists(config_store, runs_cache, filters_store):
-        store = config_store or {"available": [], "selected": []}
-        available = store.get("available", []) or []
-        selected = store.get("selected", []) or []
-
-        runs = runs_cache or []
-        keys_to_check = set(list(available) + list(selected))
-
-        def type_name_for_value(value):
-            if value is None:
-                return None
-            if isinstance(value, bool):
-                return "boolean"
-            if isinstance(value, (int, float)) and not isinstance(value, bool):
-                return "number"
-            if isinstance(value, str):
-                return "string"
-            if isinstance(value, list):
-                return "list"
-            if isinstance(value, dict):
-                return "dict"
-            return "unknown"
-
-        key_to_type: Dict[str, str] = {}
-        for key in keys_to_check:
-            seen_types = set()
-            for run in runs:
-                cfg = run.get("config", {}) or {}
-                if isinstance(cfg, dict) and key in cfg:
-                    t = type_name_for_value(cfg.get(key))
-                    if t is not None:
-                        seen_types.add(t)
-                if len(seen_types) > 1:
-                    break
-            if len(seen_types) == 0:
-                key_to_type[key] = "unknown"
-            elif len(seen_types) == 1:
-                key_to_type[key] = next(iter(seen_types))
-            else:
-                key_to_type[key] = "mixed"
-
-        key_to_str_values: Dict[str, List[str]] = {}
-        key_to_value_count: Dict[str, int] = {}
+    def render_available_keys(config_store, runs_token, last_signature):
+        # Kept apart from the selected list so filter edits never resend this one
+        available = (config_store or {}).get("available", []) or []
+        signature = dumps_json([available, runs_token])
+        if signature == last_signature:
+            raise PreventUpdate
 
-        def encode_for_set(value):
-            try:
-                return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
-            except Exception:
-                return str(value)
-
-        for key in selected:
-            values = set()
-            for run in runs:
-                cfg = run.get("config", {}) or {}
-                if isinstance(cfg, dict):
-                    v = cfg.get(key)
-                    if isinstance(v, str):
-                        values.add(v)
-            if values:
-                key_to_str_values[key] = sorted(values)
-
-        for key in keys_to_check:
-            distinct = set()
-            for run in runs:
-                cfg = run.get("config", {}) or {}
-                if not isinstance(cfg, dict):
-                    continue
-                v = cfg.get(key, None)
-                if v is None:
-                    continue
-                distinct.add(encode_for_set(v))
-            key_to_value_count[key] = len(distinct)
+        key_to_type, key_to_value_count, _ = _config_summary(runs_token)
 
         available_children = [
             dbc.ListGroupItem(
@@ -190,6 +128,27 @@ def register_filters_callbacks(app):
             )
             for key in available
         ]
+        return available_children, signature
+
+    @app.callback(
+        Output("selected-keys", "children"),
+        Output("selected-keys-signature", "data"),
+        Input("config-keys-store", "data"),
+        Input("runs-token", "data"),
+        Input("filters-store", "data"),
+        State("selected-keys-signature", "data"),
+    )
+    def render_selected_keys(config_store, runs_token, filters_store, last_signature):
+        selected = (config_store or {}).get("selected", []) or []
+        # Rendering the filter controls makes them echo their values into filters-store;
+        # skip rebuilding the list when nothing it shows has changed
+        selected_set = set(selected)
+        shown_filters = {k: v for k, v in filters_store.items() if k in selected_set} if isinstance(filters_store, dict) else {}
+        signature = dumps_json([selected, runs_token, shown_filters], sort_keys=True)
+        if signature == last_signature:
+            raise PreventUpdate
+
+        key_to_type, key_to_value_count, key_to_str_values = _config_summary(runs_token)
 
         existing_filters = filters_store or {}
 
@@ -215,17 +174,20 @@ def register_filters_callbacks(app):
             elif ktype == "number":
                 control = dbc.Row(
                     [
-                        dbc.Col(dcc.Input(id={"type": "filter-number-min", "key": key}, type="number", placeholder="min", value=current.get("min", None), style={"width": "100%"}), md=6),
-                        dbc.Col(dcc.Input(id={"type": "filter-number-max", "key": key}, type="number", placeholder="max", value=current.get("max", None), style={"width": "100%"}), md=6),
+                        dbc.Col(dcc.Input(id={"type": "filter-number-min", "key": key}, type="number", placeholder="min", value=current.get("min", None), debounce=FILTER_INPUT_DEBOUNCE_S, style={"width": "100%"}), md=6),
+                        dbc.Col(dcc.Input(id={"type": "filter-number-max", "key": key}, type="number", placeholder="max", value=current.get("max", None), debounce=FILTER_INPUT_DEBOUNCE_S, style={"width": "100%"}), md=6),
                     ],
                     class_name="g-2",
                 )
             elif ktype == "string":
                 control = dcc.Dropdown(
                     id={"type": "filter-string", "key": key},
-                    options=[{"label": v, "value": v} for v in key_to_str_values.get(key, [])],
+                    options=_string_filter_options(key_to_str_values.get(key, []), current.get("values", []) or []),
                     value=current.get("values", []),
                     multi=True,
+                    # Picks are sent once the menu closes, so a burst of selections refreshes the table once
+                    closeOnSelect=False,
+                    debounce=True,
                     placeholder="Select values...",
                     style={"width": "100%"},
                 )
@@ -259,26 +221,22 @@ def register_filters_callbacks(app):
                         style={"height": "1.25rem"},
                     ),
                 ],
-                style={"whiteSpace": "nowrap"},
+                className="text-end",
+                style=_NOWRAP_STYLE,
             )
 
+            # Label / control / buttons laid out by the .key-row grid (assets/style.css)
             selected_children.append(
                 dbc.ListGroupItem(
-                    dbc.Row(
-                        [
-                            dbc.Col(label, md=6),
-                            dbc.Col(control, md=5),
-                            dbc.Col(buttons, md=1, class_name="text-end"),
-                        ],
-                        class_name="g-2 align-items-center",
-                    ),
+                    [label, control, buttons],
                     id={"type": "selected-key", "key": key},
                     action=False,
                     color="primary",
+                    class_name="key-row",
                 )
             )
 
-        return available_children, selected_children
+        return selected_children, signature
 
     @app.callback(
         Output("filters-store", "data", allow_duplicate=True),
@@ -295,51 +253,41 @@ def register_filters_callbacks(app):
     )
     def update_filters_store(bool_values, min_values, max_values, string_values, bool_ids, min_ids, max_ids, string_ids, config_store):
         filters: Dict[str, Dict] = {}
-        selected = (config_store or {}).get("selected", []) or []
-
-        for idx, id_obj in enumerate(bool_ids or []):
-            key = id_obj.get("key")
-            if key not in selected:
-                continue
-            val = (bool_values or [None])[idx] if idx < len(bool_values or []) else None
+        selected_set = set((config_store or {}).get("selected", []) or [])
+
+        def entry(key):
+            found = filters.get(key)
+            if found is None:
+                found = filters[key] = {}
+            return found
+
+        def selected_pairs(ids, values):
+            # Ids without a matching value pair up with None, as before
+            padded = itertools.chain(values or (), itertools.repeat(None))
+            for id_obj, val in zip(ids or (), padded):
+                key = id_obj.get("key")
+                if key in selected_set:
+                    yield key, val
+
+        for key, val in selected_pairs(bool_ids, bool_values):
             if val in ("true", "false", "all"):
-                filters.setdefault(key, {})["mode"] = val
-
-        for idx, id_obj in enumerate(min_ids or []):
-            key = id_obj.get("key")
-            if key not in selected:
-                continue
-            val = (min_values or [None])[idx] if idx < len(min_values or []) else None
-            if val is not None and val != "":
-                try:
-                    filters.setdefault(key, {})["min"] = float(val)
-                except Exception:
-                    pass
-            else:
-                filters.setdefault(key, {})["min"] = None
-
-        for idx, id_obj in enumerate(max_ids or []):
-            key = id_obj.get("key")
-            if key not in selected:
-                continue
-            val = (max_values or [None])[idx] if idx < len(max_values or []) else None
-            if val is not None and val != "":
-                try:
-                    filters.setdefault(key, {})["max"] = float(val)
-                except Exception:
-                    pass
-            else:
-                filters.setdefault(key, {})["max"] = None
-
-        for idx, id_obj in enumerate(string_ids or []):
-            key = id_obj.get("key")
-            if key not in selected:
-                continue
-            vals = (string_values or [None])[idx] if idx < len(string_values or []) else None
+                entry(key)["mode"] = val
+
+        for bound, ids, values in (("min", min_ids, min_values), ("max", max_ids, max_values)):
+            for key, val in selected_pairs(ids, values):
+                if val is not None and val != "":
+                    try:
+                        entry(key)[bound] = float(val)
+                    except Exception:
+                        pass
+                else:
+                    entry(key)[bound] = None
+
+        for key, vals in selected_pairs(string_ids, string_values):
             if isinstance(vals, list):
-                filters.setdefault(key, {})["values"] = vals
+                entry(key)["values"] = vals
 
-        filtered_out = {k: v for k, v in filters.items() if k in selected}
+        filtered_out = {k: v for k, v in filters.items() if k in selected_set}
         return filtered_out
 
     @app.callback(
@@ -361,12 +309,13 @@ def register_filters_callbacks(app):
             return dash.no_update
 
         store = store or {"available": [], "selected": []}
-        available = list(store.get("available", []) or [])
-        selected = list(store.get("selected", []) or [])
+        # Insertion-ordered dicts as ordered sets: O(1) membership and removal
+        available = dict.fromkeys(store.get("available", []) or [])
+        selected = dict.fromkeys(store.get("selected", []) or [])
 
         triggered = ctx.triggered[0]["prop_id"].split(".")[0]
         try:
-            trigger_id = json.loads(triggered)
+            trigger_id = _parse_trigger_id(triggered)
         except Exception:
             return dash.no_update
 
@@ -374,37 +323,29 @@ def register_filters_callbacks(app):
             triggered_value = ctx.triggered[0].get("value", None)
         except Exception:
             triggered_value = None
-        if trigger_id.get("type") in {"available-key", "remove-selected-key", "move-up", "move-down"}:
+        kind = trigger_id.get("type")
+        key = trigger_id.get("key")
+        if kind in {"available-key", "remove-selected-key", "move-up", "move-down"}:
             if not isinstance(triggered_value, int) or triggered_value <= 0:
                 return dash.no_update
 
-        if trigger_id.get("type") == "available-key":
-            key = trigger_id.get("key")
-            if key in available:
-                available.remove(key)
-            if key not in selected:
-                selected.append(key)
-        elif trigger_id.get("type") == "remove-selected-key":
-            key = trigger_id.get("key")
-            if key in selected:
-                selected.remove(key)
+        if kind == "available-key":
+            available.pop(key, None)
+            selected.setdefault(key)
+        elif kind == "remove-selected-key":
+            selected.pop(key, None)
             if key not in available:
-                available.append(key)
-                available.sort()
-        elif trigger_id.get("type") == "move-up":
-            key = trigger_id.get("key")
-            if key in selected:
-                idx = selected.index(key)
-                if idx > 0:
-                    selected[idx - 1], selected[idx] = selected[idx], selected[idx - 1]
-        elif trigger_id.get("type") == "move-down":
-            key = trigger_id.get("key")
-            if key in selected:
-                idx = selected.index(key)
-                if idx < len(selected) - 1:
-                    selected[idx + 1], selected[idx] = selected[idx], selected[idx + 1]
-
-        return {"available": available, "selected": selected}
+                available[key] = None
+                available = dict.fromkeys(sorted(available))
+        elif kind in ("move-up", "move-down") and key in selected:
+            keys = list(selected)
+            idx = keys.index(key)
+            other = idx - 1 if kind == "move-up" else idx + 1
+            if 0 <= other < len(keys):
+                keys[other], keys[idx] = keys[idx], keys[other]
+                selected = dict.fromkeys(keys)
+
+        return {"available": list(available), "selected": list(selected)}
 
     @app.callback(
         Output("config-keys-store", "data", allow_duplicate=True),
@@ -416,14 +357,14 @@ def register_filters_callbacks(app):
         if not n_clicks:
             return dash.no_update
         store = store or {"available": [], "selected": []}
-        available = list(store.get("available", []) or [])
-        selected = list(store.get("selected", []) or [])
-        union_keys = list(available) + list(selected)
-        if len(union_keys) == 0:
+        available = store.get("available", []) or []
+        union_keys = available + (store.get("selected", []) or [])
+        if not union_keys:
             return dash.no_update
         # If everything already selected, unselect all
-        if len(available) == 0 and len(selected) == len(union_keys):
-            return {"available": sorted(union_keys), "selected": []}
+        if not available:
+            union_keys.sort()
+            return {"available": union_keys, "selected": []}
         # Otherwise select all
         return {"available": [], "selected": union_keys}
 
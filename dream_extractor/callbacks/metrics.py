@@ -1,120 +1,99 @@
-from typing import Dict, List
-from dash import Input, Output, State, no_update, dcc
-import io
-import csv
-import json
-from bson import ObjectId
+from typing import Dict, List, Tuple
+from dash import Input, Output, State, no_update
+from dash.exceptions import PreventUpdate
+import uuid
+import numpy as np
+import pandas as pd
+from ..services.data import (
+    build_steps_df,
+    filter_indices,
+    metric_ids_for,
+    metric_series,
+    metric_series_cache_for,
+)
+from ..state.cache import DOWNLOAD_CACHE, METRICS_PAYLOAD_CACHE, RUNS_CACHE
+
+
+def metrics_steps_table(runs_token, config_store, filters_store, selected_metrics_names) -> Tuple[List[Dict], List[Dict]]:
+    """
+    (columns, rows) of the metrics steps table for the UI state: one row per filtered
+    run and logged step, with the selected config keys and metric values.
+    """
+    runs = RUNS_CACHE.get(runs_token) or []
+    # A key selected twice would give the table duplicate column ids
+    selected = list(dict.fromkeys((config_store or {}).get("selected", []) or []))
+    metrics_values_map = METRICS_PAYLOAD_CACHE.get(runs_token) or {}
+    selected_metrics = [m for m in (selected_metrics_names or []) if type(m) is str and m.strip()]
+
+    active_filters = filters_store or {}
+
+    columns = [{"name": "Experiment", "id": "experiment"}] + [{"name": key, "id": key} for key in selected]
+    columns.append({"name": "Step", "id": "step"})
+    for mname in selected_metrics:
+        columns.append({"name": mname, "id": f"metric:{mname}"})
+    if not selected_metrics or not runs:
+        # No run can contribute a step row; skip filtering and the per-run scan
+        return columns, []
+
+    keep = filter_indices(runs, selected, active_filters, runs_token)
+
+    run_metric_ids = metric_ids_for(runs, runs_token)
+    series_by_mid = metric_series_cache_for(runs_token)
+
+    metric_cols = [f"metric:{mname}" for mname in selected_metrics]
+    # Config columns first, without shadowing step/metric columns of the same name
+    base_keys = [k for k in dict.fromkeys(["experiment", *selected]) if k != "step" and k not in metric_cols]
+    # Columns are accumulated across runs and turned into one frame at the end
+    base_cols: Dict[str, list] = {key: [] for key in base_keys}
+    step_parts = []
+    metric_parts: Dict[str, list] = {col: [] for col in metric_cols}
+    for i in keep:
+        run = runs[i]
+        mids = run_metric_ids[i]
+        series = {}
+        for mname, col in zip(selected_metrics, metric_cols):
+            mid = mids.get(mname)
+            if not mid:
+                continue
+            if mid not in series_by_mid:
+                series_by_mid[mid] = metric_series(metrics_values_map.get(mid))
+            if series_by_mid[mid] is not None:
+                series[col] = series_by_mid[mid]
+        # Steps a metric did not log become "", as the positional rows had; a logged NaN stays NaN
+        frame = build_steps_df(series, fill="")
+        n = len(frame)
+        if n == 0:
+            continue
+
+        cfg = run.get("config", {}) or {}
+        base_cols["experiment"].extend([run.get("experiment", "")] * n)
+        for key in base_keys[1:]:
+            base_cols[key].extend([cfg.get(key)] * n)
+        step_parts.append(frame.index.to_numpy())
+        for col in metric_cols:
+            metric_parts[col].append(frame[col].to_numpy(dtype=object) if col in frame.columns else np.full(n, "", dtype=object))
+
+    if not step_parts:
+        return columns, []
+    data = {key: pd.Series(values, dtype=object) for key, values in base_cols.items()}
+    data["step"] = np.concatenate(step_parts)
+    for col, parts in metric_parts.items():
+        data[col] = np.concatenate(parts)
+    df = pd.DataFrame(data).reindex(columns=[c["id"] for c in columns])
+    return columns, df.to_dict(orient="records")
 
 
 def register_metrics_callbacks(app):
     @app.callback(
         Output("metrics-steps-table", "columns"),
         Output("metrics-steps-table", "data"),
-        Input("runs-cache", "data"),
+        Input("runs-token", "data"),
         Input("config-keys-store", "data"),
         Input("filters-store", "data"),
         Input("metrics-select", "value"),
-        Input("metrics-values-store", "data"),
     )
-    def refresh_metrics_steps_table(runs_cache, config_store, filters_store, selected_metrics_names, metrics_values_map):
-        runs = runs_cache or []
-        selected = (config_store or {}).get("selected", [])
-        metrics_values_map = metrics_values_map or {}
-        selected_metrics = [m for m in (selected_metrics_names or []) if isinstance(m, str) and m.strip()]
-
-        active_filters = filters_store or {}
-
-        def row_passes_filters(run_cfg: Dict) -> bool:
-            for key in selected:
-                f = active_filters.get(key) if isinstance(active_filters, dict) else None
-                if not f:
-                    continue
-                value = run_cfg.get(key, None) if isinstance(run_cfg, dict) else None
-
-                mode = f.get("mode") if isinstance(f, dict) else None
-                if mode in ("true", "false"):
-                    if not isinstance(value, bool):
-                        return False
-                    desired = (mode == "true")
-                    if value != desired:
-                        return False
-
-                has_min = "min" in f and f.get("min") is not None
-                has_max = "max" in f and f.get("max") is not None
-                if has_min or has_max:
-                    if not isinstance(value, (int, float)) or isinstance(value, bool):
-                        return False
-                    if has_min and value < f.get("min"):
-                        return False
-                    if has_max and value > f.get("max"):
-                        return False
-
-                values = f.get("values") if isinstance(f, dict) else None
-                if isinstance(values, list) and len(values) > 0:
-                    if not isinstance(value, str):
-                        return False
-                    if value not in values:
-                        return False
-            return True
-
-        filtered_runs = []
-        for run in runs:
-            cfg = run.get("config", {}) or {}
-            if row_passes_filters(cfg):
-                filtered_runs.append(run)
-
-        columns = [{"name": "Experiment", "id": "experiment"}] + [{"name": key, "id": key} for key in selected]
-        columns.append({"name": "Step", "id": "step"})
-        for mname in selected_metrics:
-            columns.append({"name": mname, "id": f"metric:{mname}"})
-
-        def extract_metric_id_for_run(run_metrics, metric_name):
-            if isinstance(run_metrics, dict):
-                v = run_metrics.get(metric_name, None)
-                if isinstance(v, dict) and v.get("id") is not None:
-                    return str(v.get("id"))
-                if isinstance(v, (str, ObjectId)):
-                    return str(v)
-                return None
-            if isinstance(run_metrics, list):
-                for item in run_metrics:
-                    if isinstance(item, dict) and item.get("name") == metric_name:
-                        mid = item.get("id") or item.get("_id")
-                        if mid is not None:
-                            return str(mid)
-                        return None
-            return None
-
-        rows: List[Dict] = []
-        for run in filtered_runs:
-            base = {"experiment": run.get("experiment", "")}
-            cfg = run.get("config", {}) or {}
-            for key in selected:
-                base[key] = cfg.get(key)
-
-            run_metrics = run.get("metrics", None)
-            step_grid = None
-            metric_series: Dict[str, List] = {}
-            for mname in selected_metrics:
-                mid = extract_metric_id_for_run(run_metrics, mname)
-                payload = metrics_values_map.get(str(mid), {}) if mid else {}
-                values = payload.get("values") or []
-                steps = payload.get("steps") or list(range(len(values)))
-                metric_series[mname] = values
-                if steps and (step_grid is None or len(steps) > len(step_grid)):
-                    step_grid = steps
-            if step_grid is None:
-                continue
-
-            for idx, step in enumerate(step_grid):
-                row = dict(base)
-                row["step"] = step
-                for mname in selected_metrics:
-                    series = metric_series.get(mname, [])
-                    row[f"metric:{mname}"] = series[idx] if idx < len(series) else ""
-                rows.append(row)
-
-        return columns, rows
+    def refresh_metrics_steps_table(runs_token, config_store, filters_store, selected_metrics_names):
+        return metrics_steps_table(runs_token, config_store, filters_store, selected_metrics_names)
 
     @app.callback(
         Output("download-steps-modal", "is_open"),
@@ -128,79 +107,71 @@ def register_metrics_callbacks(app):
         return not is_open
 
     @app.callback(
-        Output("download-steps-csv", "data"),
+        Output("download-url", "data", allow_duplicate=True),
         Input("download-steps-confirm", "n_clicks"),
         State("download-steps-filename", "value"),
-        State("metrics-steps-table", "columns"),
-        State("metrics-steps-table", "data"),
+        State("runs-token", "data"),
+        State("config-keys-store", "data"),
+        State("filters-store", "data"),
+        State("metrics-select", "value"),
         prevent_initial_call=True,
     )
-    def download_steps_csv(n_clicks, filename, columns, data_rows):
+    def download_steps_csv(n_clicks, filename, runs_token, config_store, filters_store, selected_metrics_names):
         if not n_clicks:
             return no_update
-        rows = data_rows or []
-        cols = columns or []
+        # Rebuilt from the cached payloads rather than sent back from the table: the
+        # browser round trip turns logged NaN values into nulls
+        cols, rows = metrics_steps_table(runs_token, config_store, filters_store, selected_metrics_names)
         if len(rows) == 0 or len(cols) == 0:
             return no_update
 
-        col_ids = [c.get("id") for c in cols if isinstance(c, dict) and c.get("id")]
+        col_ids = [c.get("id") for c in cols if type(c) is dict and c.get("id")]
         col_names = [c.get("name", c.get("id")) for c in cols]
 
-        buf = io.StringIO()
-        writer = csv.writer(buf)
-        writer.writerow(col_names)
-
-        def stringify(v):
-            if isinstance(v, (list, dict, tuple)):
-                try:
-                    return json.dumps(v, ensure_ascii=False, default=str)
-                except Exception:
-                    return str(v)
-            return v
-
-        for row in rows:
-            writer.writerow([stringify(row.get(cid, "")) for cid in col_ids])
-
-        csv_str = buf.getvalue()
-        buf.close()
         safe_name = (filename or "").strip() or "metrics_steps.csv"
         if not safe_name.lower().endswith(".csv"):
             safe_name += ".csv"
-        return dcc.send_string(csv_str, safe_name)
+        key = str(uuid.uuid4())
+        DOWNLOAD_CACHE[key] = (safe_name, col_names, col_ids, rows)
+        return f"/download?id={key}"
 
     @app.callback(
         Output("metrics-select", "options"),
+        Output("metrics-all-values-store", "data"),
         Output("metrics-controls-row", "style"),
         Output("metrics-none-note", "children"),
         Input("metrics-store", "data"),
         State("metrics-select", "value"),
+        State("metrics-all-values-store", "data"),
     )
-    def populate_metrics_checklist(metrics_store, current_selected):
+    def populate_metrics_checklist(metrics_store, current_selected, current_values):
         names = metrics_store or []
-        if not isinstance(names, list):
+        if type(names) is not list:
             names = []
-        names = sorted([n for n in names if isinstance(n, str) and n.strip()])
-        options = [{"label": n, "value": n} for n in names]
-        if len(options) == 0:
-            return [], {"display": "none"}, "No metrics found"
-        return options, {}, ""
+        values = sorted(n for n in names if type(n) is str and n.strip())
+        if values and values == current_values:
+            # Same metrics as already rendered (e.g. a reconnect): don't resend the options
+            raise PreventUpdate
+        if len(values) == 0:
+            return [], [], {"display": "none"}, "No metrics found"
+        return [{"label": n, "value": n} for n in values], values, {}, ""
 
     @app.callback(
         Output("metrics-select", "value"),
         Input("metrics-toggle-all", "n_clicks"),
-        State("metrics-select", "options"),
+        State("metrics-all-values-store", "data"),
         State("metrics-select", "value"),
         prevent_initial_call=True,
     )
-    def toggle_all_metrics(n_clicks, options, current_values):
+    def toggle_all_metrics(n_clicks, all_values, current_values):
         if not n_clicks:
             return no_update
-        all_values = [opt.get("value") for opt in (options or []) if isinstance(opt, dict)]
+        # The option values, written alongside the options by populate_metrics_checklist
         if not all_values:
             return no_update
-        current_set = set(current_values or [])
-        all_set = set(all_values)
-        if current_set == all_set:
+        current_values = current_values or []
+        # A length mismatch already means "not everything selected"; only equal lengths need the sets
+        if len(current_values) == len(all_values) and set(current_values) == set(all_values):
             return []
         return all_values
 
@@ -215,11 +186,11 @@ def register_metrics_callbacks(app):
     @app.callback(
         Output("metrics-select", "value", allow_duplicate=True),
         Input("metrics-selected-store", "data"),
-        Input("metrics-select", "options"),
+        Input("metrics-all-values-store", "data"),
         prevent_initial_call=True,
     )
-    def restore_selected_metrics(saved_values, options):
-        available = set([opt.get("value") for opt in (options or []) if isinstance(opt, dict)])
+    def restore_selected_metrics(saved_values, all_values):
+        available = set(all_values or [])
         desired = [v for v in (saved_values or []) if v in available]
         return desired
 
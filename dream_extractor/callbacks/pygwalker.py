@@ -1,8 +1,10 @@
-from dash import Input, Output, ClientsideFunction, no_update
+from dash import Input, Output, State, ClientsideFunction, no_update
 from flask import request, make_response
+import hashlib
 import pandas as pd
 import uuid
-from ..state.cache import PYGWALKER_CACHE
+from ..state.cache import PYGWALKER_CACHE, PYGWALKER_HTML_CACHE
+from .experiments import experiments_table
 
 
 def register_pygwalker(app, server):
@@ -13,17 +15,12 @@ def register_pygwalker(app, server):
         Input("pygwalker-url", "data"),
     )
 
-    @server.route("/pygwalker")
-    def pygwalker_route():
+    def _render_pygwalker(df: pd.DataFrame) -> str:
         try:
-            key = request.args.get("id", "").strip()
-            data = PYGWALKER_CACHE.get(key, [])
-            df = pd.DataFrame(data or [])
-            try:
-                from pygwalker.api.html import to_html
-                html_str = to_html(df, title="Metrics Steps Explorer")
-            except Exception as exc:
-                html_str = f"""
+            from pygwalker.api.html import to_html
+            return to_html(df, title="Metrics Steps Explorer")
+        except Exception as exc:
+            return f"""
 <!DOCTYPE html>
 <html>
   <head><meta charset="utf-8"><title>Pygwalker unavailable</title></head>
@@ -35,8 +32,39 @@ def register_pygwalker(app, server):
   </body>
 </html>
 """.strip()
-            resp = make_response(html_str)
-            resp.headers["Content-Type"] = "text/html; charset=utf-8"
+
+    def _open_pygwalker(data):
+        # Build the frame once here; PYGWALKER_CACHE is LRU-bounded, so abandoned tabs age out
+        key = str(uuid.uuid4())
+        try:
+            PYGWALKER_CACHE[key] = pd.DataFrame(data or [])
+        except Exception:
+            return no_update
+        return f"/pygwalker?id={key}"
+
+    @server.route("/pygwalker")
+    def pygwalker_route():
+        try:
+            key = request.args.get("id", "").strip()
+            # Keys are per-click uuids over immutable data, so they double as ETags
+            etag = hashlib.md5(key.encode("utf-8")).hexdigest()
+            html_str = PYGWALKER_HTML_CACHE.get(key)
+            if html_str is not None and etag in request.if_none_match:
+                resp = make_response("", 304)
+            else:
+                if html_str is None:
+                    df = PYGWALKER_CACHE.get(key)
+                    if df is None:
+                        html_str = _render_pygwalker(pd.DataFrame())
+                        etag = None
+                    else:
+                        html_str = _render_pygwalker(df)
+                        PYGWALKER_HTML_CACHE[key] = html_str
+                resp = make_response(html_str)
+                resp.headers["Content-Type"] = "text/html; charset=utf-8"
+            if etag is not None:
+                resp.headers["ETag"] = f'"{etag}"'
+                resp.headers["Cache-Control"] = "private, max-age=300"
             return resp
         except Exception as exc:
             resp = make_response(f"Failed to render pygwalker page: {exc}")
@@ -52,29 +80,22 @@ def register_pygwalker(app, server):
     def open_pygwalker_page(n_clicks, table_data):
         if not n_clicks:
             return no_update
-        data = table_data or []
-        key = str(uuid.uuid4())
-        try:
-            PYGWALKER_CACHE[key] = data
-        except Exception:
-            return no_update
-        return f"/pygwalker?id={key}"
+        return _open_pygwalker(table_data)
 
     @app.callback(
         Output("pygwalker-url", "data", allow_duplicate=True),
         Input("open-pygwalker-exp-btn", "n_clicks"),
-        State("experiments-table", "data"),
+        State("runs-token", "data"),
+        State("config-keys-store", "data"),
+        State("filters-store", "data"),
+        State("results-select", "value"),
         prevent_initial_call=True,
     )
-    def open_pygwalker_exp_page(n_clicks, table_data):
+    def open_pygwalker_exp_page(n_clicks, runs_token, config_store, filters_store, selected_result_keys):
         if not n_clicks:
             return no_update
-        data = table_data or []
-        key = str(uuid.uuid4())
-        try:
-            PYGWALKER_CACHE[key] = data
-        except Exception:
-            return no_update
-        return f"/pygwalker?id={key}"
+        # The table only holds the current page; explore the whole filtered view
+        _, data, _ = experiments_table(runs_token, config_store, filters_store, selected_result_keys)
+        return _open_pygwalker(data)
 
 
@@ -1,5 +1,5 @@
-from dash import html, no_update
-from dash import Input, Output, State
+from dash import no_update
+from dash import Input, Output, State, MATCH, ClientsideFunction
 import dash
 
 
@@ -40,49 +40,25 @@ def register_ui_callbacks(app):
             return no_update
         history = db_history or []
         if db_name in history:
-            return history
+            # Unchanged: don't rewrite the store and re-render everything listening to it
+            return no_update
         return ([db_name] + history)[:20]
 
-    @app.callback(
+    # The history is already in the browser; build the <option> list there (see assets/clientside.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace="ui", function_name="datalist"),
         Output("db-name-list", "children"),
         Input("db-history", "data"),
     )
-    def render_db_datalist(db_history):
-        options = db_history or []
-        return [html.Option(value=opt) for opt in options]
-
-    @app.callback(
-        Output("select-keys-collapse", "is_open"),
-        Input("toggle-select-keys", "n_clicks"),
-        State("select-keys-collapse", "is_open"),
-        prevent_initial_call=True,
-    )
-    def toggle_select_keys(n_clicks, is_open):
-        if not n_clicks:
-            return no_update
-        return not is_open
-
-    @app.callback(
-        Output("experiments-collapse", "is_open"),
-        Input("toggle-experiments", "n_clicks"),
-        State("experiments-collapse", "is_open"),
-        prevent_initial_call=True,
-    )
-    def toggle_experiments(n_clicks, is_open):
-        if not n_clicks:
-            return no_update
-        return not is_open
 
-    @app.callback(
-        Output("metrics-collapse", "is_open"),
-        Input("toggle-metrics", "n_clicks"),
-        State("metrics-collapse", "is_open"),
+    # Card header toggles for the section collapses, flipped in the browser (see assets/clientside.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace="ui", function_name="toggle"),
+        Output({"type": "collapse-target", "name": MATCH}, "is_open"),
+        Input({"type": "collapse-toggle", "name": MATCH}, "n_clicks"),
+        State({"type": "collapse-target", "name": MATCH}, "is_open"),
         prevent_initial_call=True,
     )
-    def toggle_metrics(n_clicks, is_open):
-        if not n_clicks:
-            return no_update
-        return not is_open
 
     @app.callback(
         Output("db-name-input", "value"),
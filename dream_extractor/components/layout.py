@@ -9,16 +9,22 @@ def build_layout():
             dcc.Store(id="creds-store", storage_type="local"),
             dcc.Store(id="ui-store", storage_type="local"),
             dcc.Store(id="db-history", storage_type="local"),
-            dcc.Store(id="runs-cache", storage_type="memory"),
+            dcc.Store(id="runs-token", storage_type="memory"),
             dcc.Store(id="config-keys-store", storage_type="local"),
             dcc.Store(id="filters-store", storage_type="local"),
+            dcc.Store(id="config-keys-dropdown-signature", storage_type="memory"),
+            dcc.Store(id="available-keys-signature", storage_type="memory"),
+            dcc.Store(id="selected-keys-signature", storage_type="memory"),
             dcc.Store(id="metrics-store", storage_type="memory"),
-            dcc.Store(id="metrics-values-store", storage_type="memory"),
             dcc.Store(id="metrics-selected-store", storage_type="local"),
             dcc.Store(id="experiments-page-size-store", storage_type="local"),
             dcc.Store(id="metrics-page-size-store", storage_type="local"),
             dcc.Store(id="results-store", storage_type="memory"),
+            dcc.Store(id="results-all-values-store", storage_type="memory"),
+            dcc.Store(id="metrics-all-values-store", storage_type="memory"),
             dcc.Interval(id="init-tick", interval=0, n_intervals=0, max_intervals=1),
+            dcc.Store(id="connect-job", storage_type="memory"),
+            dcc.Interval(id="connect-poll", interval=250, n_intervals=0, disabled=True),
             dbc.Navbar(
                 dbc.Container(
                     [
@@ -158,7 +164,7 @@ def build_layout():
                                 html.Span("Select Keys"),
                                 html.I(className="ms-auto bi bi-chevron-down"),
                             ],
-                            id="toggle-select-keys",
+                            id={"type": "collapse-toggle", "name": "select-keys"},
                             n_clicks=0,
                             className="d-flex align-items-center",
                             style={"cursor": "pointer", "fontSize": "1.25rem", "fontWeight": "600"},
@@ -202,7 +208,7 @@ def build_layout():
                                 ]
                             )
                         ),
-                        id="select-keys-collapse",
+                        id={"type": "collapse-target", "name": "select-keys"},
                         is_open=True,
                     ),
                 ],
@@ -216,7 +222,7 @@ def build_layout():
                                 html.Span("Experiments"),
                                 html.I(className="ms-auto bi bi-chevron-down"),
                             ],
-                            id="toggle-experiments",
+                            id={"type": "collapse-toggle", "name": "experiments"},
                             n_clicks=0,
                             className="d-flex align-items-center",
                             style={"cursor": "pointer", "fontSize": "1.25rem", "fontWeight": "600"},
@@ -255,6 +261,9 @@ def build_layout():
                                     id="experiments-table",
                                     columns=[{"name": "Experiment", "id": "experiment"}],
                                     data=[],
+                                    page_action="custom",
+                                    page_current=0,
+                                    page_count=1,
                                     page_size=20,
                                     style_table={"overflowX": "auto", "width": "100%"},
                                     style_cell={"textAlign": "left", "padding": "8px"},
@@ -280,10 +289,9 @@ def build_layout():
                                     id="download-exp-modal",
                                     is_open=False,
                                 ),
-                                dcc.Download(id="download-exp-csv"),
                             ]
                         ),
-                        id="experiments-collapse",
+                        id={"type": "collapse-target", "name": "experiments"},
                         is_open=True,
                     ),
                 ],
@@ -297,7 +305,7 @@ def build_layout():
                                 html.Span("Metrics"),
                                 html.I(className="ms-auto bi bi-chevron-down"),
                             ],
-                            id="toggle-metrics",
+                            id={"type": "collapse-toggle", "name": "metrics"},
                             n_clicks=0,
                             className="d-flex align-items-center",
                             style={"cursor": "pointer", "fontSize": "1.25rem", "fontWeight": "600"},
@@ -363,12 +371,13 @@ def build_layout():
                                     id="download-steps-modal",
                                     is_open=False,
                                 ),
-                                dcc.Download(id="download-steps-csv"),
+                                dcc.Store(id="download-url"),
+                                html.Div(id="download-start-dummy", style={"display": "none"}),
                                 dcc.Store(id="pygwalker-url"),
                                 html.Div(id="pygwalker-open-dummy", style={"display": "none"}),
                             ]
                         ),
-                        id="metrics-collapse",
+                        id={"type": "collapse-target", "name": "metrics"},
                         is_open=True,
                     ),
                 ],
@@ -1,5 +1,15 @@
 import os
 
 DEFAULT_DB_NAME = os.environ.get("SACRED_DB_NAME", "sacred")
-
-
+# Cursor batch sizes: plain run documents are small, metric payloads carry whole value arrays
+RUNS_BATCH_SIZE = int(os.environ.get("SACRED_RUNS_BATCH_SIZE", "1000"))
+METRICS_BATCH_SIZE = int(os.environ.get("SACRED_METRICS_BATCH_SIZE", "50"))
+# Wire compressors offered to the server, in preference order; unavailable ones are skipped
+MONGO_COMPRESSORS = os.environ.get("SACRED_MONGO_COMPRESSORS", "zstd,snappy,zlib")
+# Seconds a connect result is reused when the same URI/database is connected again
+CONNECT_RESULT_TTL = float(os.environ.get("SACRED_CONNECT_RESULT_TTL", "30"))
+# Seconds the runs and metric payloads of a connect stay server-side after their last use
+RUNS_CACHE_TTL = float(os.environ.get("SACRED_RUNS_CACHE_TTL", "1800"))
+# Create the indexes the queries use (runs.experiment.name, metrics.run_id/name) on connect.
+# Off by default: it writes to the experiment database, which the extractor otherwise only reads
+ENSURE_INDEXES = os.environ.get("SACRED_ENSURE_INDEXES", "").strip().lower() in ("1", "true", "yes")
@@ -1,42 +1,513 @@
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools
+import json
+import operator
 from bson import ObjectId
+import numpy as np
+import pandas as pd
+from ..state.cache import CONFIG_FRAME_CACHE, CONFIG_SUMMARY_CACHE, FILTER_INDEX_CACHE, METRIC_SERIES_CACHE, RUN_METRIC_IDS_CACHE
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib encoder below produces the same text
+    orjson = None
 
 
 def collect_metric_ids_from_runs(runs: List[Dict]) -> List[str]:
     ids = set()
+    add = ids.add
     for r in runs or []:
         m = r.get("metrics", None)
-        if isinstance(m, dict):
+        if type(m) is dict:
             for val in m.values():
-                if isinstance(val, dict) and val.get("id") is not None:
-                    ids.add(str(val.get("id")))
-                elif isinstance(val, (str, ObjectId)):
-                    ids.add(str(val))
-        elif isinstance(m, list):
+                if type(val) is dict:
+                    mid = val.get("id")
+                    if mid is not None:
+                        add(mid if type(mid) is str else str(mid))
+                elif type(val) is str:
+                    add(val)
+                elif isinstance(val, ObjectId):
+                    add(str(val))
+        elif type(m) is list:
             for item in m:
-                if not isinstance(item, dict):
+                if type(item) is not dict:
                     continue
                 mid = item.get("id") or item.get("_id")
                 if mid is not None:
-                    ids.add(str(mid))
+                    add(mid if type(mid) is str else str(mid))
     return sorted(ids)
 
 
+def scan_metric_names_and_results(runs: List[Dict]) -> Tuple[List[str], List[str]]:
+    """
+    Client-side fallback for `fetch_metric_names` / `fetch_result_keys`: sorted metric
+    names and result keys found in already loaded runs.
+    """
+    metric_names = set()
+    result_keys = set()
+    add_names = metric_names.update
+    add_keys = result_keys.update
+    for r in runs or []:
+        m = r.get("metrics")
+        if type(m) is dict:
+            add_names(k for k in m if type(k) is str and k.strip())
+        elif type(m) is list:
+            add_names(
+                nm for nm in (item.get("name") for item in m if type(item) is dict)
+                if type(nm) is str and nm.strip()
+            )
+        res = r.get("result")
+        if type(res) is dict:
+            add_keys(k for k in res if type(k) is str and k.strip())
+    return sorted(metric_names), sorted(result_keys)
+
+
+_CONFIG_TYPE_LABELS = {bool: "boolean", int: "number", float: "number", str: "string", list: "list", dict: "dict"}
+# For a column holding a single one of these types, nunique() agrees with counting JSON encodings
+_RAW_DISTINCT_TYPES = {bool, int, float, str}
+
+
+def _base_type(t: type) -> type:
+    # Subclasses of the labelled types (e.g. bson's Int64, decoded for ints >= 2**31)
+    # count as their base type; bool cannot be subclassed, so it never absorbs an int
+    if t in _CONFIG_TYPE_LABELS:
+        return t
+    return next((base for base in _CONFIG_TYPE_LABELS if issubclass(t, base)), t)
+
+
+def _value_types(col: pd.Series) -> pd.Series:
+    """
+    The type of every value in `col`, with subclasses of the labelled config types
+    folded onto their base type, so exact type comparisons match isinstance checks.
+    """
+    types = col.map(type)
+    unique = types.unique()
+    if all(t in _CONFIG_TYPE_LABELS for t in unique):
+        return types
+    return types.map({t: _base_type(t) for t in unique})
+
+
+class _Absent:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "<absent>"
+
+
+# Cell value of `build_config_frame` for a key a run does not have, so it stays apart
+# from a logged None or NaN; its type is not a config type, so filters reject it
+ABSENT = _Absent()
+
+
+def build_config_frame(runs: List[Dict]) -> pd.DataFrame:
+    """
+    One object-dtype row per run, one column per top-level config key; `ABSENT`
+    where a run has no such key (or no config dict at all).
+    """
+    configs = [r.get("config") if type(r.get("config")) is dict else {} for r in runs or []]
+    cfg_df = pd.DataFrame(configs, dtype=object)
+    _fill_absent(cfg_df, configs, ABSENT)
+    return cfg_df
+
+
+def _fill_absent(df: pd.DataFrame, configs: List[Dict], fill) -> None:
+    # pandas fills absent keys with NaN; only those NaN/None cells need a lookup, and
+    # the ones whose config really lacks the key get `fill` (logged NaN/None stay)
+    for pos, key in enumerate(df.columns):
+        gaps = np.flatnonzero(df.iloc[:, pos].isna().to_numpy())
+        absent = [i for i in gaps if key not in configs[i]]
+        if absent:
+            df.iloc[absent, pos] = fill
+
+
+def config_frame_for(runs: List[Dict], runs_token: Optional[str]) -> pd.DataFrame:
+    # The runs behind a runs-token never change; a new connect issues a new token
+    if runs_token:
+        cached = CONFIG_FRAME_CACHE.get(runs_token)
+        if cached is not None and len(cached) == len(runs or []):
+            return cached
+    cfg_df = build_config_frame(runs)
+    if runs_token:
+        CONFIG_FRAME_CACHE[runs_token] = cfg_df
+    return cfg_df
+
+
+def summarize_configs(
+    runs: List[Dict], keys: Optional[Iterable[str]] = None, cfg_df: Optional[pd.DataFrame] = None
+) -> Tuple[Dict[str, str], Dict[str, int], Dict[str, List[str]]]:
+    """
+    Columnar scan of run configs for the key lists. Returns, per key (default: every
+    config key seen), the type label ("boolean"/"number"/"string"/"list"/"dict",
+    "mixed" or "unknown"), the number of distinct non-null values, and the sorted
+    string values (only for keys that have any).
+    """
+    if cfg_df is None:
+        cfg_df = build_config_frame(runs)
+    if keys is None:
+        keys = cfg_df.columns
+    key_to_type: Dict[str, str] = {}
+    key_to_value_count: Dict[str, int] = {}
+    key_to_str_values: Dict[str, List[str]] = {}
+    for key in keys:
+        if key not in cfg_df.columns:
+            key_to_type[key] = "unknown"
+            key_to_value_count[key] = 0
+            continue
+        col = cfg_df[key]
+        types = _value_types(col)
+        # Absent keys and None carry no type, as before; a logged NaN is a number
+        present = ~types.isin((_Absent, type(None))).to_numpy()
+        if not present.all():
+            col, types = col[present], types[present]
+        type_set = set(types.unique())
+        labels = {_CONFIG_TYPE_LABELS.get(t, "unknown") for t in type_set}
+        if len(labels) == 0:
+            key_to_type[key] = "unknown"
+        elif len(labels) == 1:
+            key_to_type[key] = next(iter(labels))
+        else:
+            key_to_type[key] = "mixed"
+
+        if len(type_set) == 1 and type_set <= _RAW_DISTINCT_TYPES:
+            # json.dumps writes every NaN as "NaN", so they count as one value
+            key_to_value_count[key] = int(col.nunique(dropna=False))
+        else:
+            key_to_value_count[key] = int(col.map(_hashable).nunique())
+
+        if str in type_set:
+            key_to_str_values[key] = sorted(col[types == str].unique().tolist())
+    return key_to_type, key_to_value_count, key_to_str_values
+
+
+def config_summary_for(runs: List[Dict], runs_token: Optional[str]):
+    # `summarize_configs` over the cached config frame, itself cached per runs-token
+    if runs_token:
+        cached = CONFIG_SUMMARY_CACHE.get(runs_token)
+        if cached is not None:
+            return cached
+    summary = summarize_configs(runs, cfg_df=config_frame_for(runs, runs_token))
+    if runs_token:
+        CONFIG_SUMMARY_CACHE[runs_token] = summary
+    return summary
+
+
+_MAX_HASHABLE_DEPTH = 32
+
+
+def _hashable(value, depth: int = 0):
+    """
+    Hashable stand-in for a config value that is distinct exactly when the JSON
+    encodings differ: scalars carry their type (1, 1.0 and True stay apart), lists
+    and tuples both become arrays and dicts are ordered by key.
+    """
+    kind = type(value)
+    if kind is float and value != value:
+        # NaN never equals itself, but json encodes every NaN the same way
+        return (float, "NaN")
+    if kind is str or kind is int or kind is float or kind is bool or value is None:
+        return (kind, value)
+    base = _base_type(kind)
+    if base is int or base is float or base is str:
+        # json encodes these subclasses like their base type
+        value = base(value)
+        return (float, "NaN") if value != value else (base, value)
+    if depth >= _MAX_HASHABLE_DEPTH:
+        return (str, str(value))
+    if base is list or kind is tuple:
+        return (list, tuple(_hashable(v, depth + 1) for v in value))
+    if base is dict:
+        return (dict, tuple(sorted(((str(k), _hashable(v, depth + 1)) for k, v in value.items()), key=lambda kv: kv[0])))
+    # json's default=str path
+    return (str, str(value))
+
+
+def _is_active_filter(f) -> bool:
+    if not f or not isinstance(f, dict):
+        return False
+    values = f.get("values")
+    return (
+        f.get("mode") in ("true", "false")
+        or f.get("min") is not None
+        or f.get("max") is not None
+        or (isinstance(values, list) and len(values) > 0)
+    )
+
+
+def active_filter_keys(selected: List[str], active_filters: Dict) -> List[str]:
+    """
+    The selected keys whose filter actually constrains runs ("all" modes and empty
+    bounds/selections do not).
+    """
+    if not isinstance(active_filters, dict) or not active_filters:
+        return []
+    return [key for key in selected if _is_active_filter(active_filters.get(key))]
+
+
+def filter_mask(cfg_df: pd.DataFrame, selected: List[str], active_filters: Dict) -> np.ndarray:
+    """
+    Boolean mask over the rows of `cfg_df` for the UI filter state: booleans must
+    match exactly, numeric bounds only pass numbers (not bools), string selections
+    only pass strings.
+    """
+    mask = np.ones(len(cfg_df), dtype=bool)
+    for key in active_filter_keys(selected, active_filters):
+        f = active_filters[key]
+        mode = f.get("mode")
+        has_min = f.get("min") is not None
+        has_max = f.get("max") is not None
+        values = f.get("values")
+        has_values = isinstance(values, list) and len(values) > 0
+        if key not in cfg_df.columns:
+            # Every run lacks the key, so any active constraint rejects all of them
+            return np.zeros(len(cfg_df), dtype=bool)
+        col = cfg_df[key]
+        types = _value_types(col)
+
+        if mode in ("true", "false"):
+            mask &= (types.eq(bool) & col.eq(mode == "true")).to_numpy()
+
+        if has_min or has_max:
+            is_num = types.isin((int, float))
+            num = pd.to_numeric(col.where(is_num), errors="coerce")
+            # Reject only when a bound is crossed: a logged NaN compares false both
+            # ways and passes, as it did with the per-run `value < min` checks
+            if has_min:
+                is_num &= ~(num < f["min"])
+            if has_max:
+                is_num &= ~(num > f["max"])
+            mask &= is_num.to_numpy()
+
+        if has_values:
+            is_str = types.eq(str)
+            mask &= (is_str & col.where(is_str).isin(values)).to_numpy()
+    return mask
+
+
+def filter_indices(runs: List[Dict], selected: List[str], active_filters: Dict, runs_token: Optional[str] = None) -> np.ndarray:
+    """
+    Indices of the runs passing the UI filters. Without an active filter this is
+    every index, and the config frame is not even built. With a `runs_token` the
+    result is cached on the active filters only, so edits to inactive keys and
+    triggers unrelated to filtering reuse it.
+    """
+    runs = runs or []
+    keys = active_filter_keys(selected, active_filters)
+    if not keys:
+        return np.arange(len(runs))
+    cache_key = dumps_json([runs_token, {key: active_filters[key] for key in keys}], sort_keys=True) if runs_token else None
+    indices = FILTER_INDEX_CACHE.get(cache_key) if cache_key else None
+    if indices is None:
+        indices = np.flatnonzero(filter_mask(config_frame_for(runs, runs_token), keys, active_filters))
+        if cache_key:
+            # Shared between callers, so keep it read-only
+            indices.flags.writeable = False
+            FILTER_INDEX_CACHE[cache_key] = indices
+    return indices
+
+
+def filter_runs(runs: List[Dict], selected: List[str], active_filters: Dict, runs_token: Optional[str] = None) -> List[Dict]:
+    runs = runs or []
+    if not active_filter_keys(selected, active_filters):
+        return runs
+    return [runs[i] for i in filter_indices(runs, selected, active_filters, runs_token)]
+
+
 def build_table_from_runs(runs: List[Dict], selected_keys: List[str]) -> Tuple[List[Dict], List[Dict]]:
     """
     Build DataTable columns and rows based on selected configuration keys.
     Returns (columns, data_rows).
     """
+    # A key selected twice would give the frame (and the table) duplicate column ids
+    selected_keys = list(dict.fromkeys(selected_keys))
     columns = [{"name": "Experiment", "id": "experiment"}] + [{"name": key, "id": key} for key in selected_keys]
-    rows: List[Dict] = []
+    experiments: List = []
+    configs: List[Dict] = []
     for run in runs:
-        row = {"experiment": run.get("experiment", "")}
+        experiments.append(run.get("experiment", ""))
         cfg = run.get("config", {}) or {}
-        if not isinstance(cfg, dict):
-            cfg = {}
-        for key in selected_keys:
-            row[key] = cfg.get(key)
-        rows.append(row)
+        configs.append(cfg if isinstance(cfg, dict) else {})
+    # Column selection and missing-key filling happen in pandas' record parser; object
+    # dtype keeps ints/bools/containers as-is and missing keys are mapped back to None,
+    # as cfg.get(key) gave, while logged NaN values are kept.
+    df = pd.DataFrame(configs, columns=selected_keys, dtype=object)
+    _fill_absent(df, configs, None)
+    if "experiment" not in df.columns:
+        df.insert(0, "experiment", experiments)
+    rows: List[Dict] = df.to_dict(orient="records")
     return columns, rows
 
 
+def metric_ids_by_name(run_metrics) -> Dict[str, Optional[str]]:
+    """
+    Map metric name -> metric id string for one run's `info.metrics`, either Sacred's
+    [{id, name}] list (first entry per name wins) or a name -> id / {id} dict.
+    """
+    out: Dict[str, Optional[str]] = {}
+    if isinstance(run_metrics, dict):
+        for name, v in run_metrics.items():
+            if isinstance(v, dict) and v.get("id") is not None:
+                out[name] = str(v.get("id"))
+            elif isinstance(v, (str, ObjectId)):
+                out[name] = str(v)
+            else:
+                out[name] = None
+    elif isinstance(run_metrics, list):
+        for item in run_metrics:
+            if isinstance(item, dict):
+                name = item.get("name")
+                if name in out:
+                    continue
+                mid = item.get("id") or item.get("_id")
+                out[name] = str(mid) if mid is not None else None
+    return out
+
+
+def metric_ids_for(runs: List[Dict], runs_token: Optional[str]) -> List[Dict[str, Optional[str]]]:
+    """
+    `metric_ids_by_name` for every run, resolved once per runs-token.
+    """
+    if runs_token:
+        cached = RUN_METRIC_IDS_CACHE.get(runs_token)
+        if cached is not None and len(cached) == len(runs or []):
+            return cached
+    ids = [metric_ids_by_name(r.get("metrics", None)) for r in runs or []]
+    if runs_token:
+        RUN_METRIC_IDS_CACHE[runs_token] = ids
+    return ids
+
+
+def metric_series(payload: Optional[Dict]) -> Optional[pd.Series]:
+    """
+    One metric's `{"values", "steps"}` payload as a Series indexed by "step" (steps
+    default to 0..n-1, duplicates keep the last value); None when it has no values.
+    """
+    if not payload:
+        return None
+    values = payload.get("values")
+    if values is None or len(values) == 0:
+        return None
+    steps = payload.get("steps")
+    if steps is None or len(steps) == 0:
+        steps = range(len(values))
+    n = min(len(values), len(steps))
+    # Slicing keeps ndarray payloads as views; pandas takes them without a Python-level copy
+    s = pd.Series(values[:n], index=pd.Index(steps[:n], name="step"))
+    if s.index.has_duplicates:
+        s = s[~s.index.duplicated(keep="last")]
+    return s
+
+
+def metric_series_cache_for(runs_token: Optional[str]) -> Dict[str, Optional[pd.Series]]:
+    # Payloads behind a runs-token never change, so their Series can be kept alongside
+    if not runs_token:
+        return {}
+    cache = METRIC_SERIES_CACHE.get(runs_token)
+    if cache is None:
+        cache = {}
+        METRIC_SERIES_CACHE[runs_token] = cache
+    return cache
+
+
+def build_steps_df(series_by_label: Dict[str, pd.Series], fill=None) -> pd.DataFrame:
+    """
+    Outer-join metric series (see `metric_series`) on their step values. The result
+    has one row per distinct step, sorted, indexed by "step", one column per label,
+    and NaN where a metric was not logged, or `fill` if given (logged NaN stay NaN).
+    """
+    if not series_by_label:
+        return pd.DataFrame(index=pd.Index([], name="step"))
+    df = pd.concat(series_by_label, axis=1, join="outer")
+    df.index.name = "step"
+    try:
+        df = df.sort_index()
+    except TypeError:
+        pass
+    if fill is not None:
+        for label, s in series_by_label.items():
+            # Series indexes are unique, so a full-length one covers every step
+            if len(s) != len(df):
+                df[label] = s.reindex(df.index, fill_value=fill)
+    return df
+
+
+def dumps_json(value, sort_keys: bool = False) -> str:
+    """
+    Compact JSON text for cache keys and render signatures, via orjson when
+    installed. Not for anything users see: cells go through `cell_json`.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(value, default=str, option=option).decode("utf-8")
+        except TypeError:  # e.g. ints beyond 64 bits; let json handle them
+            pass
+    return json.dumps(value, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def cell_json(value) -> str:
+    # JSON for list/dict cells in the tables and CSV downloads, with json's default
+    # ", " / ": " spacing as users have always seen it (orjson has no spaced mode)
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def loads_json(text):
+    """
+    Parse JSON text, via orjson when installed. Raises ValueError on bad input either way.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+_CONTAINER_TYPES = (list, dict, tuple)
+
+
+def _stringify_cell(v):
+    if type(v) in _CONTAINER_TYPES:
+        try:
+            return cell_json(v)
+        except Exception:
+            return str(v)
+    return v
+
+
+def iter_csv(col_names: List[str], col_ids: List[str], rows: Iterable[Dict], chunk_rows: int = 1000) -> Iterator[str]:
+    """
+    Yield CSV text in chunks of `chunk_rows` rows, so a response can be streamed
+    without ever materialising the whole file as one string. Each chunk is written
+    by pandas' CSV writer; only cells holding lists/dicts/tuples are JSON-encoded.
+    """
+    rows = iter(rows)
+    header = list(col_names)
+    getter = operator.itemgetter(*col_ids) if col_ids else (lambda row: ())
+    single = len(col_ids) == 1
+
+    def cells(row):
+        # itemgetter pulls every column in one C call; rows missing a column fall back to .get
+        try:
+            values = getter(row)
+        except KeyError:
+            return tuple(row.get(cid) for cid in col_ids)
+        return (values,) if single else values
+
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk and header is False:
+            return
+        # object dtype keeps ints as ints next to missing cells, as csv.writer did
+        df = pd.DataFrame(list(map(cells, chunk)), columns=col_ids, dtype=object)
+        for cid in col_ids:
+            col = df[cid]
+            types = col.map(type)
+            containers = types.isin(_CONTAINER_TYPES)
+            if containers.any():
+                df.loc[containers, cid] = col[containers].map(_stringify_cell)
+            # to_csv writes NaN like None; csv.writer wrote str(value), so "nan" stays
+            # apart from a missing cell
+            nans = col.isna() & types.ne(type(None))
+            if nans.any():
+                df.loc[nans, cid] = col[nans].map(str)
+        yield df.to_csv(index=False, header=header, lineterminator="\r\n")
+        header = False
+        if len(chunk) < chunk_rows:
+            return
@@ -1,6 +1,52 @@
-from typing import Dict, List, Optional, Tuple
+import atexit
+import logging
+import struct
+import threading
+import warnings
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote_plus
+import bson
 from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+import numpy as np
 import pymongo
+from pymongo.errors import OperationFailure
+from ..config import METRICS_BATCH_SIZE, MONGO_COMPRESSORS, RUNS_BATCH_SIZE
+from .data import collect_metric_ids_from_runs
+from ..state.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+# Indexes backing the queries below: {collection: [key, ...]}
+INDEXES = {
+    "runs": ["experiment.name"],
+    "metrics": ["run_id", "name"],
+}
+_INDEXED: Set[Tuple[int, str]] = set()
+# Ids per `$in` query when fetching metric payloads by id
+METRICS_IN_CHUNK = 500
+
+# MongoClient is thread-safe and pools its own sockets; keep a few alive keyed by URI.
+# Connect jobs run concurrently, so clients are created under a lock and handed out as
+# leases: one pushed out of the pool (or dropped) while leased is closed on release.
+_CLIENTS_LOCK = threading.RLock()
+_LEASES: Dict[int, int] = {}
+_RETIRED: Dict[int, pymongo.MongoClient] = {}
+
+
+def _retire_client(client: pymongo.MongoClient) -> None:
+    with _CLIENTS_LOCK:
+        if _LEASES.get(id(client)):
+            _RETIRED[id(client)] = client
+            return
+    client.close()
+
+
+_CLIENTS = LRUCache(maxsize=4, on_evict=_retire_client)
 
 
 def build_mongodb_uri(
@@ -28,6 +74,9 @@ def build_mongodb_uri(
 
     if not resolved_username:
         return f"mongodb://{resolved_host}:{resolved_port}/"
+    # Credentials must be percent-escaped, or an '@', ':' or '/' in them breaks the URI
+    resolved_username = quote_plus(resolved_username)
+    resolved_password = quote_plus(resolved_password)
 
     # Preferred explicit auth source when provided, otherwise fall back to database_name
     effective_auth_source = resolved_auth_source or resolved_db_name
@@ -39,92 +88,448 @@ def build_mongodb_uri(
     return f"mongodb://{resolved_username}:{resolved_password}@{resolved_host}:{resolved_port}/"
 
 
+def _new_client(uri: str) -> pymongo.MongoClient:
+    options = {"serverSelectionTimeoutMS": 5000, "maxPoolSize": 20}
+    # Run documents and metric arrays compress well; a URI's own setting wins
+    if MONGO_COMPRESSORS and "compressors=" not in uri.lower():
+        options["compressors"] = MONGO_COMPRESSORS
+    with warnings.catch_warnings():
+        # pymongo warns about and drops compressors whose library is not installed
+        warnings.filterwarnings("ignore", message="Wire protocol compression", category=UserWarning)
+        return pymongo.MongoClient(uri, **options)
+
+
+@contextmanager
+def leased_client(uri: str) -> Iterator[pymongo.MongoClient]:
+    """
+    The cached MongoClient for `uri`, created on first use, so repeated connects
+    reuse the pool instead of paying TCP/TLS and handshake costs again. The client
+    stays open for the duration of the block even if it leaves the pool meanwhile.
+    """
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(uri)
+        if client is None:
+            client = _new_client(uri)
+            _CLIENTS[uri] = client
+        _LEASES[id(client)] = _LEASES.get(id(client), 0) + 1
+    try:
+        yield client
+    finally:
+        retired = None
+        with _CLIENTS_LOCK:
+            remaining = _LEASES.pop(id(client)) - 1
+            if remaining:
+                _LEASES[id(client)] = remaining
+            else:
+                retired = _RETIRED.pop(id(client), None)
+        if retired is not None:
+            retired.close()
+
+
+def drop_client(uri: str) -> None:
+    # e.g. after a failed ping; other jobs still holding it keep it until they finish
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.pop(uri)
+    if client is not None:
+        _retire_client(client)
+
+
+def close_clients() -> None:
+    # Process shutdown only: closes leased clients too
+    with _CLIENTS_LOCK:
+        clients = _CLIENTS.values() + list(_RETIRED.values())
+        _CLIENTS.clear()
+        _RETIRED.clear()
+    for client in clients:
+        client.close()
+
+
+atexit.register(close_clients)
+
+
+# Final run shape built server-side: {experiment: str, config: dict, metrics, result}
+RUNS_SHAPE = {
+    "_id": 0,
+    "experiment": {"$cond": [{"$eq": [{"$type": "$experiment.name"}, "string"]}, "$experiment.name", ""]},
+    "config": {"$cond": [{"$eq": [{"$type": "$config"}, "object"]}, "$config", {}]},
+    "metrics": "$info.metrics",
+    "result": "$info.result",
+}
+# The source fields RUNS_SHAPE reads; projected early where later stages would otherwise
+# carry whole runs (captured_out, artifacts, host info, ...) through the pipeline
+RUNS_FIELDS = {"experiment.name": 1, "config": 1, "info.metrics": 1, "info.result": 1}
+
+# Shared pipeline fragments, used standalone and as `$facet` branches of the connect bundle
+EXPERIMENT_NAMES_STAGES = [
+    {"$group": {"_id": "$experiment.name"}},
+    {"$match": {"_id": {"$type": "string", "$regex": r"\S"}}},
+    {"$sort": {"_id": 1}},
+]
+# One group collecting the distinct key *sets*; runs mostly share a schema so this stays small
+CONFIG_KEYS_STAGES = [
+    {"$match": {"config": {"$type": "object"}}},
+    {
+        "$group": {
+            "_id": None,
+            "keys": {"$addToSet": {"$map": {"input": {"$objectToArray": "$config"}, "as": "c", "in": "$$c.k"}}},
+        }
+    },
+]
+
+
+# Distinct metric names (info.metrics as Sacred's [{id, name}] list or a name -> id dict)
+# and result keys; prefixed with a `$limit` so they cover the same runs the tables load
+METRIC_NAMES_STAGES = [
+    {
+        "$project": {
+            "names": {
+                "$switch": {
+                    "branches": [
+                        {"case": {"$eq": [{"$type": "$info.metrics"}, "array"]}, "then": "$info.metrics.name"},
+                        {
+                            "case": {"$eq": [{"$type": "$info.metrics"}, "object"]},
+                            "then": {"$map": {"input": {"$objectToArray": "$info.metrics"}, "as": "m", "in": "$$m.k"}},
+                        },
+                    ],
+                    "default": [],
+                }
+            }
+        }
+    },
+    {"$unwind": "$names"},
+    {"$match": {"names": {"$type": "string", "$regex": r"\S"}}},
+    {"$group": {"_id": "$names"}},
+    {"$sort": {"_id": 1}},
+]
+RESULT_KEYS_STAGES = [
+    {"$match": {"info.result": {"$type": "object"}}},
+    {"$project": {"keys": {"$map": {"input": {"$objectToArray": "$info.result"}, "as": "r", "in": "$$r.k"}}}},
+    {"$unwind": "$keys"},
+    {"$match": {"keys": {"$regex": r"\S"}}},
+    {"$group": {"_id": "$keys"}},
+    {"$sort": {"_id": 1}},
+]
+
+
+def _flatten_key_sets(docs) -> List[str]:
+    keys = set()
+    for doc in docs:
+        for key_set in doc.get("keys", []):
+            keys.update(key_set)
+    return sorted(keys)
+
+
+# BSON element type byte -> (numpy dtype, value width) for homogeneous numeric arrays
+_BSON_NUMERIC_TYPES = {0x01: ("<f8", 8), 0x10: ("<i4", 4), 0x12: ("<i8", 8)}
+
+
+def _bson_numeric_array(raw: bytes, start: int, end: int) -> Optional[np.ndarray]:
+    """
+    Decode the elements of a BSON array occupying raw[start:end] straight into a
+    NumPy array, without creating a Python object per element. Only arrays whose
+    elements all share one numeric type (double/int32/int64) and use the canonical
+    "0", "1", ... keys are handled; returns None otherwise.
+    """
+    n_bytes = end - start
+    if n_bytes <= 0:
+        return np.empty(0, dtype=np.float64)
+    spec = _BSON_NUMERIC_TYPES.get(raw[start])
+    if spec is None:
+        return None
+    dtype, width = spec
+    # Element i takes: type byte + decimal key + NUL + value; solve for the element count
+    n, remaining, digits, block = 0, n_bytes, 1, 10
+    while remaining > 0:
+        per = 2 + width + digits
+        take = min(block, remaining // per)
+        if take < block:
+            if take * per != remaining:
+                return None
+            n += take
+            break
+        n += block
+        remaining -= block * per
+        digits += 1
+        block = 9 * 10 ** (digits - 1)
+    idx = np.arange(n, dtype=np.int64)
+    key_len = np.ones(n, dtype=np.int64)
+    bound = 10
+    while bound < n:
+        key_len += idx >= bound
+        bound *= 10
+    sizes = 2 + width + key_len
+    offsets = start + np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    if not (np.all(buf[offsets] == raw[start]) and np.all(buf[offsets + 1 + key_len] == 0)):
+        return None
+    values = buf[(offsets + 2 + key_len)[:, None] + np.arange(width)].view(dtype).reshape(n)
+    return values.astype(np.int64) if dtype == "<i4" else values
+
+
+def _raw_array_spans(raw: bytes) -> Dict[str, Tuple[int, int]]:
+    """
+    Locate top-level array fields of a raw BSON document as {name: (start, end)}
+    byte spans of their elements. Stops at the first element type whose width is
+    not known here; callers fall back to regular decoding for missing names.
+    """
+    spans: Dict[str, Tuple[int, int]] = {}
+    pos, end = 4, len(raw) - 1
+    while pos < end:
+        etype = raw[pos]
+        name_end = raw.index(b"\x00", pos + 1)
+        name = raw[pos + 1:name_end].decode("utf-8")
+        pos = name_end + 1
+        if etype == 0x04:
+            (size,) = struct.unpack_from("<i", raw, pos)
+            spans[name] = (pos + 4, pos + size - 1)
+            pos += size
+        elif etype == 0x07:
+            pos += 12
+        else:
+            break
+    return spans
+
+
+def decode_metric_payload(doc: RawBSONDocument) -> Dict:
+    """
+    Build a {"values", "steps"} payload from a raw metric document, decoding the
+    arrays via NumPy when they are homogeneous numeric arrays and through the
+    regular BSON decoder otherwise.
+    """
+    # Nested raw documents expose a memoryview; bytes() is a no-op for top-level ones
+    raw = bytes(doc.raw)
+    spans = _raw_array_spans(raw)
+    payload: Dict = {}
+    for field in ("values", "steps"):
+        arr = _bson_numeric_array(raw, *spans[field]) if field in spans else None
+        payload[field] = arr if arr is not None else list(doc.get(field, []) or [])
+    return payload
+
+
+def _inflate_raw(value):
+    kind = type(value)
+    if kind is RawBSONDocument:
+        return bson.decode(value.raw)
+    if kind is list:
+        return [_inflate_raw(v) for v in value]
+    return value
+
+
+def list_collections(client: pymongo.MongoClient, database_name: str) -> Set[str]:
+    """
+    One `listCollections` round trip whose result can be passed as `known_collections`
+    to the fetch_* helpers below, instead of each helper probing on its own.
+    """
+    return set(client[database_name].list_collection_names())
+
+
+def _has_collection(db, name: str, known_collections: Optional[Set[str]]) -> bool:
+    if known_collections is None:
+        known_collections = set(db.list_collection_names())
+    return name in known_collections
+
+
+def ensure_indexes(client: pymongo.MongoClient, database_name: str) -> None:
+    """
+    Create the indexes in INDEXES once per (client, database). This writes to the
+    user's database, so callers only do it when ENSURE_INDEXES is set. create_index
+    is idempotent server-side; a refusal (e.g. a read-only user) is logged and the
+    queries simply run unindexed, other errors propagate.
+    """
+    marker = (id(client), database_name)
+    if marker in _INDEXED:
+        return
+    db = client[database_name]
+    for coll_name, keys in INDEXES.items():
+        for key in keys:
+            try:
+                db[coll_name].create_index([(key, pymongo.ASCENDING)])
+            except OperationFailure as exc:
+                logger.warning("Could not create index %s.%s on %r: %s", coll_name, key, database_name, exc)
+    _INDEXED.add(marker)
+
+
 def fetch_sacred_experiment_names(client: pymongo.MongoClient, database_name: str) -> List[str]:
+    # Group, filter and sort server-side; a missing `runs` collection simply yields no groups.
+    # Sorting on the grouped key first lets the server walk the experiment.name index.
+    runs_coll = client[database_name]["runs"]
+    pipeline = [{"$sort": {"experiment.name": 1}}] + EXPERIMENT_NAMES_STAGES
+    try:
+        cursor = runs_coll.aggregate(pipeline, allowDiskUse=False, batchSize=1000, hint=[("experiment.name", 1)])
+    except OperationFailure:
+        # Hinted index missing (e.g. never created for a read-only user): run unhinted
+        try:
+            cursor = runs_coll.aggregate(pipeline, allowDiskUse=False, batchSize=1000)
+        except OperationFailure:
+            return []
+    return [doc["_id"] for doc in cursor]
+
+
+def fetch_config_keys(
+    client: pymongo.MongoClient, database_name: str, known_collections: Optional[Set[str]] = None
+) -> List[str]:
     db = client[database_name]
-    if "runs" not in db.list_collection_names():
+    if not _has_collection(db, "runs", known_collections):
         return []
-    names = db["runs"].distinct("experiment.name")
-    cleaned = sorted([n for n in names if isinstance(n, str) and n.strip()])
-    return cleaned
+    return _flatten_key_sets(db["runs"].aggregate(CONFIG_KEYS_STAGES, allowDiskUse=True))
+
+
+def _fetch_distinct(
+    client: pymongo.MongoClient, database_name: str, stages: List[Dict], limit: int
+) -> Optional[List[str]]:
+    try:
+        docs = client[database_name]["runs"].aggregate([{"$limit": limit}] + stages, allowDiskUse=True)
+        return [doc["_id"] for doc in docs]
+    except OperationFailure:
+        return None
+
+
+def fetch_metric_names(client: pymongo.MongoClient, database_name: str, limit: int = 500) -> Optional[List[str]]:
+    """
+    Sorted distinct metric names over the first `limit` runs, or None if the server
+    rejects the pipeline (callers then scan the loaded runs instead).
+    """
+    return _fetch_distinct(client, database_name, METRIC_NAMES_STAGES, limit)
+
 
+def fetch_result_keys(client: pymongo.MongoClient, database_name: str, limit: int = 500) -> Optional[List[str]]:
+    # Same contract as fetch_metric_names, for the keys of dict-valued info.result
+    return _fetch_distinct(client, database_name, RESULT_KEYS_STAGES, limit)
 
-def fetch_config_keys(client: pymongo.MongoClient, database_name: str) -> List[str]:
+
+def fetch_runs_docs(
+    client: pymongo.MongoClient,
+    database_name: str,
+    limit: int = 500,
+    known_collections: Optional[Set[str]] = None,
+) -> List[Dict]:
+    """
+    Shaped run documents without their metric payloads; the fallback when the
+    connect bundle or the runs/metrics join is rejected by the server.
+    """
     db = client[database_name]
-    if "runs" not in db.list_collection_names():
+    if not _has_collection(db, "runs", known_collections):
         return []
+    pipeline = [{"$limit": limit}, {"$project": RUNS_SHAPE}]
+    return list(db["runs"].aggregate(pipeline, batchSize=RUNS_BATCH_SIZE))
+
+
+def fetch_runs_with_metrics(
+    client: pymongo.MongoClient, database_name: str, limit: int = 500
+) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """
+    Fetch run documents joined server-side (`$lookup` on `metrics.run_id`) with
+    their metric values/steps. Returns (runs, metrics_values_map) where the map
+    matches the shape of `fetch_metrics_values_map`. Servers that reject the join
+    get the same result from `fetch_runs_docs` plus `fetch_metrics_values_map`.
+    """
+    try:
+        return _fetch_runs_joined(client, database_name, limit)
+    except OperationFailure:
+        runs = fetch_runs_docs(client, database_name, limit=limit)
+        return runs, fetch_metrics_values_map(client, database_name, collect_metric_ids_from_runs(runs))
+
+
+def _fetch_runs_joined(client: pymongo.MongoClient, database_name: str, limit: int) -> Tuple[List[Dict], Dict[str, Dict]]:
+    # The sub-pipeline trims metric docs (timestamps, names, ...) inside the join, and the
+    # $unwind right after it is merged into the $lookup by the server: each output doc
+    # carries one metric, so a run with many long metrics cannot exceed the 16 MB limit
     pipeline = [
-        {"$match": {"config": {"$type": "object"}}},
-        {"$project": {"cfg": {"$objectToArray": "$config"}}},
-        {"$unwind": "$cfg"},
-        {"$group": {"_id": "$cfg.k"}},
-        {"$project": {"_id": 0, "k": "$_id"}},
-        {"$sort": {"k": 1}},
+        {"$limit": limit},
+        {"$project": RUNS_FIELDS},
+        {
+            "$lookup": {
+                "from": "metrics",
+                "let": {"run_id": "$_id"},
+                "pipeline": [{"$match": {"$expr": {"$eq": ["$run_id", "$$run_id"]}}}, {"$project": {"values": 1, "steps": 1}}],
+                "as": "metric_doc",
+            }
+        },
+        {"$unwind": {"path": "$metric_doc", "preserveNullAndEmptyArrays": True}},
+        {"$project": {**RUNS_SHAPE, "_id": 1, "metric_doc": 1}},
     ]
-    keys = [doc["k"] for doc in db["runs"].aggregate(pipeline)]
-    return keys
+    runs: List[Dict] = []
+    values_by_id: Dict[str, Dict] = {}
+    runs_coll = client[database_name].get_collection("runs", codec_options=RAW_CODEC_OPTIONS)
+    run_id = None
+    # Docs carry full metric arrays, so keep batches small to cap peak memory
+    for doc in runs_coll.aggregate(pipeline, allowDiskUse=True, batchSize=METRICS_BATCH_SIZE):
+        mdoc = doc.get("metric_doc")
+        if mdoc is not None:
+            values_by_id[str(mdoc["_id"])] = decode_metric_payload(mdoc)
+        # $unwind keeps one run's docs adjacent; the run fields repeat on each of them
+        if not runs or doc["_id"] != run_id:
+            run_id = doc["_id"]
+            runs.append({k: _inflate_raw(v) for k, v in doc.items() if k != "_id" and k != "metric_doc"})
+    return runs, values_by_id
 
 
-def fetch_runs_docs(client: pymongo.MongoClient, database_name: str, limit: int = 500) -> List[Dict]:
-    db = client[database_name]
-    if "runs" not in db.list_collection_names():
-        return []
-    cursor = db["runs"].find({}, {"experiment.name": 1, "config": 1, "info.metrics": 1, "info.result": 1}).limit(limit)
-    runs: List[Dict] = []
-    for doc in cursor:
-        exp_name = None
-        exp = doc.get("experiment")
-        if isinstance(exp, dict):
-            exp_name = exp.get("name")
-        if not isinstance(exp_name, str):
-            exp_name = ""
-        cfg = doc.get("config")
-        cfg = cfg if isinstance(cfg, dict) else {}
-        info = doc.get("info") if isinstance(doc.get("info", {}), dict) else {}
-        metrics = (info or {}).get("metrics", None)
-        result = (info or {}).get("result", None)
-        runs.append({"experiment": exp_name, "config": cfg, "metrics": metrics, "result": result})
-    return runs
-
-
-def fetch_metrics_list(client: pymongo.MongoClient, database_name: str, limit: int = 1000) -> List[Dict]:
-    db = client[database_name]
-    if "metrics" not in db.list_collection_names():
-        return []
-    items: List[Dict] = []
+def fetch_connect_bundle(
+    client: pymongo.MongoClient, database_name: str, limit: int = 500, include_runs: bool = True
+) -> Dict[str, Optional[List]]:
+    """
+    Fetch experiment names, config keys, the metric names and result keys of the
+    first `limit` runs and (optionally) those run documents with a single `$facet`
+    aggregation, i.e. one scan of `runs` instead of five.
+    Returns {"names", "keys", "metric_names", "result_keys", "runs"}; metric_names and
+    result_keys are None when they could not be computed server-side.
+    """
+    head = [{"$limit": limit}]
+    facets = {
+        "names": EXPERIMENT_NAMES_STAGES,
+        "keys": CONFIG_KEYS_STAGES,
+        "metric_names": head + METRIC_NAMES_STAGES,
+        "result_keys": head + RESULT_KEYS_STAGES,
+    }
+    if include_runs:
+        facets["runs"] = head + [{"$project": RUNS_SHAPE}]
+    pipeline = [{"$facet": facets}]
     try:
-        cursor = db["metrics"].find({}, {"_id": 1, "name": 1, "title": 1}).limit(limit)
-        for doc in cursor:
-            _id = str(doc.get("_id"))
-            name = doc.get("name") or doc.get("title") or _id
-            if not isinstance(name, str):
-                name = str(name)
-            items.append({"id": _id, "name": name})
-        items.sort(key=lambda x: x.get("name", ""))
-    except Exception:
-        return []
-    return items
+        docs = list(client[database_name]["runs"].aggregate(pipeline, allowDiskUse=True))
+    except OperationFailure:
+        # The facet output is a single document bound by the 16 MB BSON limit; large
+        # run configs can exceed it, so fall back to separate queries.
+        known = list_collections(client, database_name)
+        return {
+            "names": fetch_sacred_experiment_names(client, database_name),
+            "keys": fetch_config_keys(client, database_name, known_collections=known),
+            "metric_names": fetch_metric_names(client, database_name, limit=limit),
+            "result_keys": fetch_result_keys(client, database_name, limit=limit),
+            "runs": fetch_runs_docs(client, database_name, limit=limit, known_collections=known) if include_runs else [],
+        }
+    bundle = docs[0] if docs else {}
+    return {
+        "names": [doc["_id"] for doc in bundle.get("names", [])],
+        "keys": _flatten_key_sets(bundle.get("keys", [])),
+        "metric_names": [doc["_id"] for doc in bundle.get("metric_names", [])],
+        "result_keys": [doc["_id"] for doc in bundle.get("result_keys", [])],
+        "runs": bundle.get("runs", []),
+    }
 
 
-def fetch_metrics_values_map(client: pymongo.MongoClient, database_name: str, id_strs: List[str]) -> Dict[str, Dict]:
+def fetch_metrics_values_map(
+    client: pymongo.MongoClient,
+    database_name: str,
+    id_strs: List[str],
+    known_collections: Optional[Set[str]] = None,
+) -> Dict[str, Dict]:
     if not id_strs:
         return {}
     db = client[database_name]
-    if "metrics" not in db.list_collection_names():
+    if not _has_collection(db, "metrics", known_collections):
         return {}
-    object_ids = []
-    for s in id_strs:
-        try:
-            object_ids.append(ObjectId(s))
-        except Exception:
-            continue
+    is_valid = ObjectId.is_valid
+    object_ids = [ObjectId(s) for s in id_strs if is_valid(s)]
     if not object_ids:
         return {}
     values_by_id: Dict[str, Dict] = {}
-    for doc in db["metrics"].find({"_id": {"$in": object_ids}}, {"values": 1, "steps": 1}):
-        values_by_id[str(doc.get("_id"))] = {
-            "values": doc.get("values", []),
-            "steps": doc.get("steps", []),
-        }
+    metrics_coll = db.get_collection("metrics", codec_options=RAW_CODEC_OPTIONS)
+    # Bounded $in lists keep each query document small and the server's plan cheap
+    for start in range(0, len(object_ids), METRICS_IN_CHUNK):
+        chunk = object_ids[start:start + METRICS_IN_CHUNK]
+        # Metric docs carry large values/steps arrays, so keep batches small to cap peak memory
+        for doc in metrics_coll.find({"_id": {"$in": chunk}}, {"values": 1, "steps": 1}).batch_size(METRICS_BATCH_SIZE):
+            values_by_id[str(doc["_id"])] = decode_metric_payload(doc)
     return values_by_id
 
 
@@ -1,6 +1,130 @@
-from typing import Dict, List
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from ..config import CONNECT_RESULT_TTL, RUNS_CACHE_TTL
 
-# Simple in-memory cache to pass data to the pygwalker page
-PYGWALKER_CACHE: Dict[str, List[Dict]] = {}
 
+class LRUCache:
+    """
+    Small thread-safe mapping that keeps at most `maxsize` entries, evicting the
+    least recently used one first. Entries older than `ttl` seconds (if given)
+    are treated as missing; with `sliding=True` every read restarts that clock,
+    so `ttl` becomes an idle timeout. Expired entries at the least recently used
+    end are dropped on each access rather than waiting for the size bound.
+    `on_evict` is called with values pushed out by the size bound or the ttl, or
+    replaced under an existing key (e.g. to close resources).
+    """
 
+    def __init__(
+        self,
+        maxsize: int = 32,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[Any], None]] = None,
+        sliding: bool = False,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.sliding = sliding
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float, evicted: list) -> None:
+        # Oldest first, so stop at the first live entry (exact when sliding)
+        while self.ttl is not None and self._data:
+            key, (stored_at, value) = next(iter(self._data.items()))
+            if now - stored_at <= self.ttl:
+                break
+            del self._data[key]
+            evicted.append(value)
+
+    def _report(self, evicted: list) -> None:
+        if self.on_evict is not None:
+            for old in evicted:
+                self.on_evict(old)
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            previous = self._data.get(key)
+            if previous is not None and previous[1] is not value:
+                evicted.append(previous[1])
+            self._data[key] = (now, value)
+            self._data.move_to_end(key)
+            self._expire(now, evicted)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[1][1])
+        self._report(evicted)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is not None and now - stored_at > self.ttl:
+                    del self._data[key]
+                    evicted.append(value)
+                    entry = None
+                elif self.sliding:
+                    self._data[key] = (now, value)
+                if entry is not None:
+                    self._data.move_to_end(key)
+            self._expire(now, evicted)
+        self._report(evicted)
+        return default if entry is None else entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def values(self) -> list:
+        with self._lock:
+            return [value for _, value in self._data.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_MISSING = object()
+
+# In-memory cache to pass data to the pygwalker page, keyed by a per-click uuid.
+# Holds DataFrames built once at write time so the route does not rebuild them.
+PYGWALKER_CACHE = LRUCache(maxsize=32, ttl=600)
+# Rendered pygwalker pages for the same keys; to_html is slow, so reloads reuse them.
+PYGWALKER_HTML_CACHE = LRUCache(maxsize=16, ttl=600)
+
+# Pending CSV downloads (filename, header, column ids, rows), streamed by /download; rows may
+# be a lazy iterator that builds them from the cached runs as the response is written.
+DOWNLOAD_CACHE = LRUCache(maxsize=8, ttl=300)
+
+# Shaped run documents per connect, keyed by the runs-token the browser holds instead of the runs.
+# Dropped after RUNS_CACHE_TTL idle seconds; the browser is then asked to reconnect.
+RUNS_CACHE = LRUCache(maxsize=16, ttl=RUNS_CACHE_TTL, sliding=True)
+# Decoded metric payloads ({"values", "steps"} ndarrays by metric id) for the same tokens.
+METRICS_PAYLOAD_CACHE = LRUCache(maxsize=16, ttl=RUNS_CACHE_TTL, sliding=True)
+# Last successful connect per (uri, db name): (runs-token, config keys, metric names, result keys).
+CONNECT_RESULT_CACHE = LRUCache(maxsize=8, ttl=CONNECT_RESULT_TTL)
+# Filtered run lists per (runs-token, selected keys, filters), so table paging skips re-filtering.
+EXPERIMENT_VIEW_CACHE = LRUCache(maxsize=8)
+# Indices of the runs passing the active filters per (runs-token, active filters), shared by both tables.
+FILTER_INDEX_CACHE = LRUCache(maxsize=8)
+# Config key summaries (types, distinct counts, string values) per runs-token, i.e. per connect.
+CONFIG_SUMMARY_CACHE = LRUCache(maxsize=8)
+# Object-dtype config DataFrames per runs-token, shared by the key summary and the table filters.
+CONFIG_FRAME_CACHE = LRUCache(maxsize=8)
+# Per runs-token: metric name -> id for every run, and metric id -> step-indexed Series.
+RUN_METRIC_IDS_CACHE = LRUCache(maxsize=8)
+METRIC_SERIES_CACHE = LRUCache(maxsize=4)
@@ -7,6 +7,7 @@ from dream_extractor.callbacks.filters import register_filters_callbacks
 from dream_extractor.callbacks.experiments import register_experiments_callbacks
 from dream_extractor.callbacks.metrics import register_metrics_callbacks
 from dream_extractor.callbacks.pygwalker import register_pygwalker
+from dream_extractor.callbacks.downloads import register_downloads
 
 
 def create_and_configure_app():
@@ -18,6 +19,7 @@ def create_and_configure_app():
     register_experiments_callbacks(app)
     register_metrics_callbacks(app)
     register_pygwalker(app, server)
+    register_downloads(app, server)
     return app
 
 
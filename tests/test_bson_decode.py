@@ -0,0 +1,59 @@
+import bson
+import numpy as np
+import pytest
+from bson.int64 import Int64
+from bson.raw_bson import RawBSONDocument
+
+from dream_extractor.services.mongo import decode_metric_payload
+
+
+def _raw(doc):
+    return RawBSONDocument(bson.encode(doc))
+
+
+@pytest.mark.parametrize("n", [0, 1, 9, 10, 11, 99, 100, 101, 1000, 1234])
+def test_numeric_arrays_round_trip_across_key_widths(n):
+    values = [i * 0.25 - 3.0 for i in range(n)]
+    steps = list(range(n))
+    # Field order of a projected metric document: _id, steps, values
+    payload = decode_metric_payload(_raw({"_id": bson.ObjectId(), "steps": steps, "values": values}))
+    assert isinstance(payload["values"], np.ndarray) and isinstance(payload["steps"], np.ndarray)
+    assert payload["values"].tolist() == values
+    assert payload["steps"].tolist() == steps
+    if n:
+        assert payload["steps"].dtype == np.int64
+
+
+def test_int64_and_int32_arrays_decode_to_int64():
+    big = [Int64(2**40 + i) for i in range(12)]
+    payload = decode_metric_payload(_raw({"_id": bson.ObjectId(), "values": big, "steps": [1, 2, 3]}))
+    assert payload["values"].dtype == np.int64
+    assert payload["values"].tolist() == [int(v) for v in big]
+    assert payload["steps"].tolist() == [1, 2, 3]
+
+
+def test_heterogeneous_arrays_fall_back_to_bson_decoding():
+    values = [1.5, 2, None, "nan", 3.0]
+    payload = decode_metric_payload(_raw({"_id": bson.ObjectId(), "values": values, "steps": [0, 1, Int64(2**40), 3, 4]}))
+    assert payload["values"] == values
+    assert payload["steps"] == [0, 1, 2**40, 3, 4]
+
+
+def test_missing_fields_decode_as_empty():
+    payload = decode_metric_payload(_raw({"_id": bson.ObjectId(), "values": [0.5, 1.5]}))
+    assert payload["values"].tolist() == [0.5, 1.5]
+    assert list(payload["steps"]) == []
+
+
+def test_unscanned_leading_fields_fall_back_to_bson_decoding():
+    # The span scanner stops at fields it cannot size (here an int _id and a string)
+    doc = {"_id": 1, "name": "acc", "steps": [0, 1], "values": [0.5, 1.5]}
+    payload = decode_metric_payload(_raw(doc))
+    assert payload == {"values": [0.5, 1.5], "steps": [0, 1]}
+
+
+def test_nested_raw_documents_from_a_join():
+    outer = _raw({"_id": 7, "metric_doc": {"_id": bson.ObjectId(), "values": [1.0, 2.0, 3.0], "steps": [0, 5, 10]}})
+    payload = decode_metric_payload(outer["metric_doc"])
+    assert payload["values"].tolist() == [1.0, 2.0, 3.0]
+    assert payload["steps"].tolist() == [0, 5, 10]
@@ -0,0 +1,104 @@
+import pytest
+
+from dream_extractor.state import cache as cache_module
+from dream_extractor.state.cache import LRUCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_evicts_least_recently_used_first():
+    evicted = []
+    lru = LRUCache(maxsize=2, on_evict=evicted.append)
+    lru["a"] = 1
+    lru["b"] = 2
+    assert lru.get("a") == 1  # "b" is now the oldest
+    lru["c"] = 3
+    assert evicted == [2]
+    assert "b" not in lru and "a" in lru and "c" in lru
+    assert len(lru) == 2
+
+
+def test_replacing_a_value_reports_the_old_one_only():
+    evicted = []
+    lru = LRUCache(maxsize=2, on_evict=evicted.append)
+    value = object()
+    lru["a"] = value
+    lru["a"] = value
+    assert evicted == []
+    lru["a"] = "new"
+    assert evicted == [value]
+    assert lru.get("a") == "new"
+
+
+def test_entries_expire_after_ttl(clock):
+    lru = LRUCache(maxsize=4, ttl=10)
+    lru["a"] = 1
+    clock.now += 10
+    assert lru.get("a") == 1
+    clock.now += 0.5
+    assert lru.get("a", "gone") == "gone"
+    assert "a" not in lru
+    assert len(lru) == 0
+
+
+def test_ttl_counts_from_the_last_write_not_the_last_read(clock):
+    lru = LRUCache(maxsize=4, ttl=10)
+    lru["a"] = 1
+    clock.now += 8
+    assert lru.get("a") == 1
+    clock.now += 8
+    assert lru.get("a") is None
+    lru["a"] = 2
+    clock.now += 8
+    assert lru.get("a") == 2
+
+
+def test_sliding_ttl_counts_from_the_last_read(clock):
+    lru = LRUCache(maxsize=4, ttl=10, sliding=True)
+    lru["a"] = 1
+    for _ in range(3):
+        clock.now += 8
+        assert lru.get("a") == 1
+    clock.now += 10.5
+    assert "a" not in lru
+
+
+def test_expired_entries_are_dropped_without_being_read(clock):
+    evicted = []
+    lru = LRUCache(maxsize=4, ttl=10, sliding=True, on_evict=evicted.append)
+    lru["idle"] = 1
+    lru["busy"] = 2
+    clock.now += 8
+    assert lru.get("busy") == 2
+    clock.now += 5
+    # Touching another key releases the idle entry; the busy one is still live
+    assert lru.get("busy") == 2
+    assert evicted == [1]
+    assert len(lru) == 1
+
+
+def test_pop_values_and_clear():
+    evicted = []
+    lru = LRUCache(maxsize=4, on_evict=evicted.append)
+    lru["a"] = 1
+    lru["b"] = 2
+    assert lru.pop("a") == 1
+    assert lru.pop("a", "missing") == "missing"
+    assert lru.values() == [2]
+    lru.clear()
+    assert len(lru) == 0 and lru.values() == []
+    # pop/clear hand values back to the caller rather than evicting them
+    assert evicted == []
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+
+from bson.int64 import Int64
+
+from dream_extractor.services.data import iter_csv
+
+COL_NAMES = ["Experiment", "lr", "tags", "Step", "loss"]
+COL_IDS = ["experiment", "lr", "tags", "step", "metric:loss"]
+
+
+def _reference_csv(col_names, col_ids, rows):
+    # csv.writer over json-encoded containers, as the downloads were written before streaming
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(col_names)
+
+    def stringify(v):
+        if isinstance(v, (list, dict, tuple)):
+            return json.dumps(v, ensure_ascii=False, default=str)
+        return v
+
+    for row in rows:
+        writer.writerow([stringify(row.get(cid, "")) for cid in col_ids])
+    return buf.getvalue()
+
+
+ROWS = [
+    {"experiment": "exp", "lr": 0.1, "tags": [1, {"k": "v"}], "step": 0, "metric:loss": 1.5},
+    {"experiment": 'quote "me", please', "lr": None, "tags": ("a", "é"), "step": 1, "metric:loss": ""},
+    {"experiment": "multi\nline", "lr": True, "tags": {"nested": [1, 2]}, "step": Int64(2), "metric:loss": 1e-300},
+    {"experiment": "missing cells", "step": 3},
+]
+
+
+def test_iter_csv_matches_csv_writer_output():
+    assert "".join(iter_csv(COL_NAMES, COL_IDS, ROWS)) == _reference_csv(COL_NAMES, COL_IDS, ROWS)
+
+
+def test_iter_csv_keeps_json_spacing_in_container_cells():
+    text = "".join(iter_csv(["tags"], ["tags"], [{"tags": [1, {"k": "v"}]}]))
+    assert text == 'tags\r\n"[1, {""k"": ""v""}]"\r\n'
+
+
+def test_iter_csv_chunks_rows_and_always_writes_a_header():
+    rows = [{"a": i} for i in range(5)]
+    chunks = list(iter_csv(["A"], ["a"], rows, chunk_rows=2))
+    assert chunks == ["A\r\n0\r\n1\r\n", "2\r\n3\r\n", "4\r\n"]
+    assert list(iter_csv(["A"], ["a"], [])) == ["A\r\n"]
+    assert "".join(iter_csv(["A"], ["a"], rows[:4], chunk_rows=2)) == "A\r\n0\r\n1\r\n2\r\n3\r\n"
+
+
+def test_iter_csv_writes_nan_apart_from_missing_cells():
+    rows = [{"lr": float("nan"), "loss": ""}, {"lr": None}, {"lr": 0.5, "loss": float("nan")}]
+    text = "".join(iter_csv(["lr", "loss"], ["lr", "loss"], rows))
+    assert text == _reference_csv(["lr", "loss"], ["lr", "loss"], rows)
+    assert text.splitlines()[1:] == ["nan,", ",", "0.5,nan"]
@@ -0,0 +1,217 @@
+import json
+
+import numpy as np
+
+from bson import ObjectId
+from bson.int64 import Int64
+
+from dream_extractor.services.data import (
+    ABSENT,
+    build_config_frame,
+    build_steps_df,
+    build_table_from_runs,
+    collect_metric_ids_from_runs,
+    filter_mask,
+    filter_runs,
+    metric_series,
+    summarize_configs,
+)
+
+
+def _reference_type_label(values):
+    # The isinstance ladder the key lists used before the columnar summary
+    labels = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            labels.add("boolean")
+        elif isinstance(value, (int, float)):
+            labels.add("number")
+        elif isinstance(value, str):
+            labels.add("string")
+        elif isinstance(value, list):
+            labels.add("list")
+        elif isinstance(value, dict):
+            labels.add("dict")
+        else:
+            labels.add("unknown")
+    if not labels:
+        return "unknown"
+    return labels.pop() if len(labels) == 1 else "mixed"
+
+
+def _reference_distinct_count(values):
+    return len({json.dumps(v, sort_keys=True, ensure_ascii=False, default=str) for v in values if v is not None})
+
+
+CONFIG_VALUES = {
+    "big": [Int64(5000000000), Int64(5000000000), Int64(7)],
+    "mixed_ints": [Int64(5), 5, 6],
+    "numbers": [1, 1.0, 2.5],
+    "flags": [True, False, True],
+    "bool_and_int": [True, 1, 0],
+    "names": ["a", "b", "a"],
+    "lists": [[1, 2], [1, 2], (1, 2)],
+    "dicts": [{"a": 1, "b": 2}, {"b": 2, "a": 1}, {"a": Int64(1)}],
+    "tuples": [(1,), (1,), (2,)],
+    "sparse": [None, 3, None],
+    "nans": [float("nan"), float("nan"), 1.5],
+    "all_nan": [float("nan")] * 3,
+    "nan_in_lists": [[float("nan")], [float("nan")], "x"],
+}
+
+
+def _runs():
+    n = len(next(iter(CONFIG_VALUES.values())))
+    return [{"config": {key: values[i] for key, values in CONFIG_VALUES.items()}} for i in range(n)]
+
+
+def test_summarize_configs_matches_isinstance_labels():
+    key_to_type, _, _ = summarize_configs(_runs())
+    for key, values in CONFIG_VALUES.items():
+        assert key_to_type[key] == _reference_type_label(values), key
+    assert key_to_type["big"] == "number"
+
+
+def test_summarize_configs_counts_distinct_json_encodings():
+    _, key_to_value_count, _ = summarize_configs(_runs())
+    for key, values in CONFIG_VALUES.items():
+        assert key_to_value_count[key] == _reference_distinct_count(values), key
+
+
+def test_summarize_configs_string_values_and_missing_keys():
+    key_to_type, key_to_value_count, key_to_str_values = summarize_configs(_runs(), keys=["names", "absent"])
+    assert key_to_str_values == {"names": ["a", "b"]}
+    assert key_to_type["absent"] == "unknown"
+    assert key_to_value_count["absent"] == 0
+
+
+def test_summarize_configs_keeps_nan_apart_from_absent_keys():
+    runs = [{"config": {"lr": float("nan")}}, {"config": {"lr": float("nan")}}, {"config": {}}, {}]
+    key_to_type, key_to_value_count, _ = summarize_configs(runs)
+    assert key_to_type == {"lr": "number"}
+    assert key_to_value_count == {"lr": 1}
+    cfg_df = build_config_frame(runs)
+    assert cfg_df["lr"].map(type).tolist() == [float, float, type(ABSENT), type(ABSENT)]
+
+
+def _reference_passes(cfg, selected, filters):
+    # The per-run predicate the tables used before filtering moved to filter_mask
+    for key in selected:
+        f = filters.get(key)
+        if not f:
+            continue
+        value = cfg.get(key)
+        if f.get("mode") in ("true", "false"):
+            if not isinstance(value, bool) or value != (f["mode"] == "true"):
+                return False
+        has_min = f.get("min") is not None
+        has_max = f.get("max") is not None
+        if has_min or has_max:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return False
+            if has_min and value < f["min"]:
+                return False
+            if has_max and value > f["max"]:
+                return False
+        values = f.get("values")
+        if isinstance(values, list) and values:
+            if not isinstance(value, str) or value not in values:
+                return False
+    return True
+
+
+FILTER_RUNS = [
+    {"config": {"n": Int64(5000000000), "lr": 0.1, "flag": True, "name": "a"}},
+    {"config": {"n": Int64(3), "lr": 1, "flag": False, "name": "b"}},
+    {"config": {"n": 2, "lr": True, "flag": 1, "name": ["a"]}},
+    {"config": {"n": "4", "lr": None, "flag": "true", "name": "c"}},
+    {"config": {"lr": 2.5}},
+    {"config": "not a dict"},
+    {},
+]
+
+FILTER_CASES = [
+    {"n": {"min": 1.0}},
+    {"n": {"max": 4}},
+    {"n": {"min": 3, "max": 3}},
+    {"lr": {"min": 0.5}},
+    {"flag": {"mode": "true"}},
+    {"flag": {"mode": "false"}},
+    {"flag": {"mode": "all"}},
+    {"name": {"values": ["a", "c"]}},
+    {"name": {"values": []}},
+    {"missing": {"min": 0}},
+    {"n": {"min": 1}, "name": {"values": ["a", "b"]}, "flag": {"mode": "true"}},
+]
+
+
+def test_filter_mask_matches_per_run_predicate():
+    cfg_df = build_config_frame(FILTER_RUNS)
+    for filters in FILTER_CASES:
+        selected = list(filters)
+        expected = [
+            _reference_passes(r.get("config") if isinstance(r.get("config"), dict) else {}, selected, filters)
+            for r in FILTER_RUNS
+        ]
+        assert filter_mask(cfg_df, selected, filters).tolist() == expected, filters
+
+
+def test_filter_mask_lets_logged_nan_through_numeric_bounds():
+    runs = [{"config": {"lr": float("nan")}}, {"config": {"lr": 0.5}}, {"config": {"lr": None}}, {"config": {}}]
+    cfg_df = build_config_frame(runs)
+    for filters in ({"lr": {"min": 0.1}}, {"lr": {"max": 0.1}}, {"lr": {"min": 0, "max": 1}}):
+        expected = [_reference_passes(r["config"], ["lr"], filters) for r in runs]
+        assert filter_mask(cfg_df, ["lr"], filters).tolist() == expected, filters
+    assert filter_mask(cfg_df, ["lr"], {"lr": {"min": 0.1}}).tolist() == [True, True, False, False]
+
+
+def test_filter_runs_keeps_int64_values_in_numeric_ranges():
+    assert filter_runs(FILTER_RUNS, ["n"], {"n": {"min": 1.0}}) == FILTER_RUNS[:3]
+    assert filter_runs(FILTER_RUNS, ["n"], {"n": {"min": 4}}) == FILTER_RUNS[:1]
+
+
+def test_filter_runs_without_active_filters_returns_runs():
+    assert filter_runs(FILTER_RUNS, ["n"], {"n": {"mode": "all", "values": []}}) is FILTER_RUNS
+
+
+def test_collect_metric_ids_from_runs_reads_list_and_dict_forms():
+    oid = ObjectId()
+    runs = [
+        {"metrics": [{"id": "b", "name": "loss"}, {"_id": oid, "name": "acc"}, {"name": "no id"}, "junk"]},
+        {"metrics": {"loss": {"id": "a"}, "acc": "c", "lr": oid, "bad": {"id": None}, "n": 3}},
+        {"metrics": None},
+        {},
+    ]
+    assert collect_metric_ids_from_runs(runs) == sorted({"a", "b", "c", str(oid)})
+
+
+def test_build_table_from_runs_matches_cfg_get():
+    nan = float("nan")
+    runs = [
+        {"experiment": "a", "config": {"lr": nan, "n": 1, "opt": None}},
+        {"experiment": "b", "config": {"n": Int64(2), "tags": [1]}},
+        {"config": "not a dict"},
+    ]
+    keys = ["lr", "n", "opt", "tags", "lr"]
+    columns, rows = build_table_from_runs(runs, keys)
+    assert [c["id"] for c in columns] == ["experiment", "lr", "n", "opt", "tags"]
+    expected = [
+        {"experiment": r.get("experiment", ""), **{k: (r["config"] if isinstance(r["config"], dict) else {}).get(k) for k in keys}}
+        for r in runs
+    ]
+    assert [list(row) for row in rows] == [list(e) for e in expected]
+    assert rows[0]["lr"] != rows[0]["lr"]  # the logged NaN
+    rows[0]["lr"] = expected[0]["lr"] = None
+    assert rows == expected
+
+
+def test_build_steps_df_fills_only_steps_a_metric_did_not_log():
+    loss = metric_series({"values": np.array([1.0, np.nan, 3.0]), "steps": np.array([0, 1, 2])})
+    acc = metric_series({"values": np.array([0.5]), "steps": np.array([1])})
+    df = build_steps_df({"loss": loss, "acc": acc}, fill="")
+    assert df.index.tolist() == [0, 1, 2]
+    assert df["acc"].tolist() == ["", 0.5, ""]
+    assert df["loss"].iloc[1] != df["loss"].iloc[1]  # logged NaN, not filled
+    assert build_steps_df({"loss": loss, "acc": acc})["acc"].isna().sum() == 2
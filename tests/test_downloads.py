@@ -0,0 +1,74 @@
+import uuid
+
+import pytest
+
+from dream_extractor.callbacks.experiments import experiments_table, iter_experiments_rows
+from dream_extractor.state.cache import DOWNLOAD_CACHE, RUNS_CACHE
+from main import create_and_configure_app
+
+
+@pytest.fixture(scope="module")
+def client():
+    return create_and_configure_app().server.test_client()
+
+
+def _download(client, filename, rows=({"a": 1, "b": [1, 2]},)):
+    key = str(uuid.uuid4())
+    DOWNLOAD_CACHE[key] = (filename, ["A", "B"], ["a", "b"], list(rows))
+    resp = client.get(f"/download?id={key}")
+    # Drain the streamed body inside the request context it was started in
+    resp.get_data()
+    return resp
+
+
+def test_download_streams_csv(client):
+    resp = _download(client, "runs.csv")
+    assert resp.status_code == 200
+    assert resp.headers["Content-Disposition"] == 'attachment; filename="runs.csv"'
+    assert resp.get_data(as_text=True).splitlines()[0] == "A,B"
+
+
+@pytest.mark.parametrize(
+    "filename, ascii_name, exact",
+    [
+        ("数据.csv", ".csv", "%E6%95%B0%E6%8D%AE.csv"),
+        ("résumé.csv", "resume.csv", "r%C3%A9sum%C3%A9.csv"),
+        ("bad\r\nSet-Cookie: x.csv", "badSet-Cookie: x.csv", None),
+        ('quo"te\\.csv', "quote.csv", None),
+    ],
+)
+def test_download_header_survives_unusual_names(client, filename, ascii_name, exact):
+    resp = _download(client, filename)
+    assert resp.status_code == 200
+    header = resp.headers["Content-Disposition"]
+    assert header.startswith(f'attachment; filename="{ascii_name}"')
+    assert "\r" not in header and "\n" not in header
+    header.encode("latin-1")
+    if exact is None:
+        assert "filename*=" not in header
+    else:
+        assert header.endswith(f"; filename*=UTF-8''{exact}")
+
+
+def test_expired_download_is_404(client):
+    assert client.get("/download?id=missing").status_code == 404
+
+
+def test_experiment_rows_are_built_lazily_in_chunks(client):
+    token = uuid.uuid4().hex
+    RUNS_CACHE[token] = [
+        {"experiment": f"e{i}", "config": {"lr": i / 10, "tags": ["a", i]}, "result": {"acc": i}} for i in range(7)
+    ]
+    state = (token, {"selected": ["lr", "tags"]}, {"lr": {"min": 0.2}}, ["acc"])
+    columns, rows, total = experiments_table(*state)
+    lazy_columns, lazy_total, lazy_rows = iter_experiments_rows(*state, chunk_runs=2)
+    assert lazy_columns == columns and lazy_total == total == 5
+    assert list(lazy_rows) == rows
+
+    key = str(uuid.uuid4())
+    _, _, lazy_rows = iter_experiments_rows(*state, chunk_runs=2)
+    DOWNLOAD_CACHE[key] = ("runs.csv", [c["name"] for c in columns], [c["id"] for c in columns], lazy_rows)
+    resp = client.get(f"/download?id={key}")
+    lines = resp.get_data(as_text=True).splitlines()
+    assert lines[0] == "Experiment,lr,tags,acc"
+    assert len(lines) == 6
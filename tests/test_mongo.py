@@ -0,0 +1,221 @@
+import threading
+
+import bson
+import numpy as np
+import pytest
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import OperationFailure
+
+from dream_extractor.services import mongo
+from dream_extractor.services.mongo import drop_client, ensure_indexes, fetch_runs_with_metrics, leased_client
+from dream_extractor.state.cache import LRUCache
+
+
+def _shape(run):
+    return {
+        "experiment": run["experiment"]["name"],
+        "config": run["config"],
+        "metrics": run["info"]["metrics"],
+        "result": run["info"].get("result"),
+    }
+
+
+class _Cursor(list):
+    def batch_size(self, n):
+        return self
+
+
+class _Collection:
+    """
+    Just enough of a pymongo collection for the runs/metrics fetches: the joined
+    aggregation is evaluated in Python (or rejected), any other runs pipeline
+    returns the shaped runs.
+    """
+
+    def __init__(self, db, name, raw=False):
+        self.db, self.name, self.raw = db, name, raw
+
+    def _out(self, doc):
+        return RawBSONDocument(bson.encode(doc)) if self.raw else doc
+
+    def aggregate(self, pipeline, **kwargs):
+        limit = next(stage["$limit"] for stage in pipeline if "$limit" in stage)
+        runs = self.db.docs["runs"][:limit]
+        if not any("$lookup" in stage for stage in pipeline):
+            return _Cursor(self._out(_shape(run)) for run in runs)
+        if self.db.reject_lookup:
+            raise OperationFailure("$lookup with 'pipeline' is not supported")
+        out = []
+        for run in runs:
+            metric_docs = [m for m in self.db.docs["metrics"] if m["run_id"] == run["_id"]]
+            for mdoc in metric_docs or [None]:
+                doc = {"_id": run["_id"], **_shape(run)}
+                if mdoc is not None:
+                    doc["metric_doc"] = {"_id": mdoc["_id"], "values": mdoc["values"], "steps": mdoc["steps"]}
+                out.append(self._out(doc))
+        return _Cursor(out)
+
+    def find(self, query, projection=None):
+        ids = set(query["_id"]["$in"])
+        return _Cursor(
+            self._out({"_id": m["_id"], "values": m["values"], "steps": m["steps"]})
+            for m in self.db.docs["metrics"]
+            if m["_id"] in ids
+        )
+
+
+class _Database:
+    def __init__(self, docs, reject_lookup):
+        self.docs, self.reject_lookup = docs, reject_lookup
+
+    def get_collection(self, name, codec_options=None):
+        return _Collection(self, name, raw=codec_options is not None)
+
+    def __getitem__(self, name):
+        return _Collection(self, name)
+
+    def list_collection_names(self):
+        return list(self.docs)
+
+
+class _Client:
+    def __init__(self, docs, reject_lookup=False):
+        self.db = _Database(docs, reject_lookup)
+
+    def __getitem__(self, name):
+        return self.db
+
+
+def _sacred_docs():
+    runs, metrics = [], []
+    for run_id in range(4):
+        info_metrics = []
+        # Run 2 logged no metrics at all
+        for name in () if run_id == 2 else ("loss", "acc"):
+            mid = ObjectId()
+            steps = list(range(0, 3 + run_id))
+            metrics.append({"_id": mid, "run_id": run_id, "name": name, "steps": steps, "values": [s * 0.5 for s in steps], "timestamps": steps})
+            info_metrics.append({"id": str(mid), "name": name})
+        runs.append({
+            "_id": run_id,
+            "experiment": {"name": f"exp_{run_id % 2}"},
+            "config": {"lr": 0.1 * run_id, "seed": run_id},
+            "info": {"metrics": info_metrics, "result": {"score": run_id}},
+        })
+    return {"runs": runs, "metrics": metrics}
+
+
+def _as_lists(values_map):
+    return {mid: {k: np.asarray(v).tolist() for k, v in payload.items()} for mid, payload in values_map.items()}
+
+
+def test_fetch_runs_with_metrics_regroups_unwound_docs():
+    docs = _sacred_docs()
+    runs, values_map = fetch_runs_with_metrics(_Client(docs), "sacred")
+    assert runs == [_shape(run) for run in docs["runs"]]
+    assert _as_lists(values_map) == {
+        str(m["_id"]): {"values": m["values"], "steps": m["steps"]} for m in docs["metrics"]
+    }
+
+
+def test_fetch_runs_with_metrics_falls_back_when_lookup_is_rejected():
+    docs = _sacred_docs()
+    joined = fetch_runs_with_metrics(_Client(docs), "sacred", limit=3)
+    fallback = fetch_runs_with_metrics(_Client(docs, reject_lookup=True), "sacred", limit=3)
+    assert fallback[0] == joined[0]
+    assert _as_lists(fallback[1]) == _as_lists(joined[1])
+    assert len(joined[0]) == 3
+
+
+class _FakeMongoClient:
+    def __init__(self, uri):
+        self.uri = uri
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client_pool(monkeypatch):
+    created = []
+
+    def new_client(uri):
+        client = _FakeMongoClient(uri)
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(mongo, "_new_client", new_client)
+    monkeypatch.setattr(mongo, "_CLIENTS", LRUCache(maxsize=2, on_evict=mongo._retire_client))
+    monkeypatch.setattr(mongo, "_LEASES", {})
+    monkeypatch.setattr(mongo, "_RETIRED", {})
+    return created
+
+
+def test_concurrent_leases_share_one_client(client_pool):
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def job():
+        barrier.wait()
+        with leased_client("mongodb://a/") as client:
+            seen.append(client)
+
+    threads = [threading.Thread(target=job) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(client_pool) == 1
+    assert all(client is client_pool[0] for client in seen)
+    assert not client_pool[0].closed
+
+
+def test_evicted_client_stays_open_until_released(client_pool):
+    with leased_client("mongodb://a/") as first:
+        with leased_client("mongodb://b/"), leased_client("mongodb://c/"):
+            pass
+        # "a" was pushed out of the pool of two, but this block still uses it
+        assert not first.closed
+    assert first.closed
+    with leased_client("mongodb://a/") as again:
+        assert again is not first
+
+
+def test_dropped_client_is_closed_after_last_lease(client_pool):
+    with leased_client("mongodb://a/") as outer:
+        with leased_client("mongodb://a/") as inner:
+            assert inner is outer
+            drop_client("mongodb://a/")
+        assert not outer.closed
+    assert outer.closed
+    drop_client("mongodb://unknown/")
+
+
+class _IndexingClient:
+    def __init__(self, refuse):
+        self.refuse = refuse
+        self.created = []
+
+    def __getitem__(self, name):
+        return self
+
+    def create_index(self, keys, **kwargs):
+        if self.refuse:
+            raise OperationFailure("not authorized on sacred to execute command { createIndexes: ... }", code=13)
+        self.created.append(keys)
+
+
+def test_ensure_indexes_creates_each_index_once():
+    client = _IndexingClient(refuse=False)
+    ensure_indexes(client, "sacred")
+    ensure_indexes(client, "sacred")
+    assert len(client.created) == sum(len(keys) for keys in mongo.INDEXES.values())
+
+
+def test_ensure_indexes_logs_refusals(caplog):
+    client = _IndexingClient(refuse=True)
+    with caplog.at_level("WARNING", logger=mongo.__name__):
+        ensure_indexes(client, "sacred")
+    assert "not authorized" in caplog.text